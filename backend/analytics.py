@@ -0,0 +1,127 @@
+﻿"""Аналитика воронки клиентов: история статусов и инкрементальные дневные агрегаты
+
+record_status_change() вызывается в той же транзакции, что и смена статуса,
+и обновляет client_funnel_daily и client_cohort_daily одним upsert на строку,
+поэтому отчёты читают только агрегаты и не сканируют историю.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def _day(value: Optional[datetime]) -> str:
+    return value.strftime("%Y-%m-%d") if value else ""
+
+
+def _upsert_funnel(db: Session, day: str, owner_id: int, status: str, **increments):
+    table = models.ClientFunnelDaily.__table__
+    values = {"entered": 0, "exited": 0, "time_in_stage_seconds": 0, **increments}
+    db.execute(
+        insert(table)
+        .values(day=day, owner_id=owner_id, status=status, **values)
+        .on_conflict_do_update(
+            index_elements=["day", "owner_id", "status"],
+            set_={name: table.c[name] + value for name, value in increments.items()}
+        )
+    )
+
+
+def _upsert_cohort(db: Session, cohort_day: str, owner_id: int, status: str, **increments):
+    table = models.ClientCohortDaily.__table__
+    values = {"created": 0, "reached": 0, **increments}
+    db.execute(
+        insert(table)
+        .values(cohort_day=cohort_day, owner_id=owner_id, status=status, **values)
+        .on_conflict_do_update(
+            index_elements=["cohort_day", "owner_id", "status"],
+            set_={name: table.c[name] + value for name, value in increments.items()}
+        )
+    )
+
+
+def record_status_change(
+    db: Session,
+    client_id: int,
+    owner_id: int,
+    from_status: Optional[str],
+    to_status: str,
+    client_created_at: Optional[datetime],
+    changed_by_id: Optional[int] = None,
+    changed_at: Optional[datetime] = None,
+    is_creation: bool = False
+):
+    """Записать смену статуса клиента в историю и агрегаты (без commit)
+
+    is_creation=True - клиент только что создан: он попадает в когорту своего дня.
+    from_status=None без is_creation - у клиента не было статуса (старые записи):
+    выход из этапа не учитывается.
+    """
+    changed_at = changed_at or datetime.utcnow()
+    history = models.ClientStatusHistory.__table__
+
+    previous_change = None
+    already_reached = False
+    if not is_creation:
+        previous_change = db.execute(
+            select(history.c.changed_at)
+            .where(history.c.client_id == client_id)
+            .order_by(history.c.id.desc())
+            .limit(1)
+        ).scalar()
+        already_reached = db.execute(
+            select(history.c.id)
+            .where(history.c.client_id == client_id, history.c.to_status == to_status)
+            .limit(1)
+        ).first() is not None
+
+    db.execute(history.insert().values(
+        client_id=client_id,
+        owner_id=owner_id,
+        from_status=from_status,
+        to_status=to_status,
+        changed_by_id=changed_by_id,
+        changed_at=changed_at
+    ))
+
+    day = _day(changed_at)
+    _upsert_funnel(db, day, owner_id, to_status, entered=1)
+    if from_status is not None:
+        entered_at = previous_change or client_created_at or changed_at
+        seconds = max(0, int((changed_at - entered_at).total_seconds()))
+        _upsert_funnel(db, day, owner_id, from_status, exited=1, time_in_stage_seconds=seconds)
+
+    cohort_day = _day(client_created_at or changed_at)
+    if is_creation:
+        _upsert_cohort(db, cohort_day, owner_id, to_status, created=1, reached=1)
+    elif not already_reached:
+        _upsert_cohort(db, cohort_day, owner_id, to_status, reached=1)
+
+
+def reassign_owner(db: Session, from_owner_id: int, to_owner_id: int):
+    """Перенести историю и агрегаты с одного владельца на другого (без commit)
+
+    Вызывается при передаче клиентов, чтобы созданные ранее когорты и
+    последующие переходы считались у одного владельца.
+    """
+    history = models.ClientStatusHistory.__table__
+    db.execute(
+        history.update().where(history.c.owner_id == from_owner_id).values(owner_id=to_owner_id)
+    )
+
+    funnel = models.ClientFunnelDaily.__table__
+    for row in db.execute(select(funnel).where(funnel.c.owner_id == from_owner_id)).all():
+        _upsert_funnel(
+            db, row.day, to_owner_id, row.status,
+            entered=row.entered, exited=row.exited, time_in_stage_seconds=row.time_in_stage_seconds
+        )
+    db.execute(funnel.delete().where(funnel.c.owner_id == from_owner_id))
+
+    cohort = models.ClientCohortDaily.__table__
+    for row in db.execute(select(cohort).where(cohort.c.owner_id == from_owner_id)).all():
+        _upsert_cohort(db, row.cohort_day, to_owner_id, row.status, created=row.created, reached=row.reached)
+    db.execute(cohort.delete().where(cohort.c.owner_id == from_owner_id))
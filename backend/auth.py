@@ -49,6 +49,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_token_email(token: str) -> Optional[str]:
+    """Извлечение email из JWT токена без обращения к базе (None, если токен недействителен)"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
@@ -60,22 +68,14 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    email = decode_token_email(token)
+    if email is None:
         raise credentials_exception
     
     user = db.query(models.User).filter(models.User.email == email).first()
     if user is None:
         raise credentials_exception
     
-    # Обновляем время последнего входа
-    user.last_login = datetime.utcnow()
-    db.commit()
-    
     return user
 
 async def get_current_active_user(
@@ -0,0 +1,84 @@
+﻿"""Замер холодного старта воркера: python -m backend.bench [--runs N] [--output FILE]
+
+Каждый прогон - отдельный процесс: импорт backend.main и проверка готовности
+(схема проверена, пул прогрет). Полный lifespan не выполняется: пул задач и
+шина кэша в пробном процессе забирали бы задачи из рабочей базы и
+обрывали их при выходе. Медиана времени импорта сравнивается с бюджетом
+IMPORT_BUDGET_SECONDS; при превышении код выхода 1.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Бюджет времени импорта приложения
+IMPORT_BUDGET_SECONDS = 1.5
+
+_PROBE = """
+import json, time
+started = time.perf_counter()
+from backend import main
+imported = time.perf_counter()
+
+# Только шаг готовности из lifespan, без jobs.runner и шины кэша
+main.health.warm_up(main.STARTED_AT)
+ready = time.perf_counter()
+state = dict(main.health._state)
+print(json.dumps({
+    "import_seconds": imported - started,
+    "ready_seconds": ready - started,
+    "ready": state["ready"],
+    "reason": state["reason"],
+}))
+"""
+
+
+def measure(runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        spawned = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE], capture_output=True, text=True, check=True
+        ).stdout
+        sample = json.loads(output.strip().splitlines()[-1])
+        sample["process_seconds"] = time.perf_counter() - spawned
+        samples.append(sample)
+
+    return {
+        "benchmark": "worker_cold_start",
+        "runs": runs,
+        "import_seconds_median": round(statistics.median(s["import_seconds"] for s in samples), 4),
+        "ready_seconds_median": round(statistics.median(s["ready_seconds"] for s in samples), 4),
+        "process_seconds_median": round(statistics.median(s["process_seconds"] for s in samples), 4),
+        "ready": all(s["ready"] for s in samples),
+        "reason": next((s["reason"] for s in samples if not s["ready"]), None),
+        "import_budget_seconds": IMPORT_BUDGET_SECONDS,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="дописать результат строкой JSON в файл")
+    args = parser.parse_args()
+
+    # SQLite создаёт пустой файл при подключении - не плодим базы в чужих каталогах
+    from .database import engine
+    if engine.url.get_backend_name() == "sqlite" and not os.path.exists(engine.url.database):
+        print(f"База {os.path.abspath(engine.url.database)} не найдена: запускайте из каталога с базой",
+              file=sys.stderr)
+        sys.exit(2)
+
+    result = measure(args.runs)
+    line = json.dumps(result, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    if result["import_seconds_median"] > IMPORT_BUDGET_SECONDS:
+        print(f"Импорт дольше бюджета {IMPORT_BUDGET_SECONDS} с", file=sys.stderr)
+        sys.exit(1)
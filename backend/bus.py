@@ -0,0 +1,194 @@
+﻿"""Шина инвалидации кэша между воркерами
+
+По умолчанию воркеры одной машины обмениваются датаграммами через Unix-сокеты
+в общем каталоге CACHE_BUS_DIR. Если задан CACHE_BUS_URL (redis://...),
+используется Redis pub/sub; вместо настоящего Redis подойдёт любой клиент
+с методами publish() и pubsub().
+
+Доставка не гарантирована (датаграмма может потеряться, подписка - оборваться),
+поэтому кэш дополнительно ограничивает возраст ответов. После переподключения
+к Redis получатель получает on_message(None): сбросить всё.
+"""
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Настройки шины инвалидации
+CACHE_BUS_URL = os.getenv("CACHE_BUS_URL", "")
+CACHE_BUS_DIR = os.getenv("CACHE_BUS_DIR", "./run/cache-bus")
+CACHE_BUS_SEND_TIMEOUT = 0.5
+CACHE_BUS_RECONNECT_SECONDS = 1
+
+OnMessage = Callable[[Optional[List[str]]], None]
+
+
+def _encode(origin: str, scopes: List[str]) -> bytes:
+    return json.dumps({"origin": origin, "scopes": scopes}).encode("utf-8")
+
+
+class UnixSocketBus:
+    """Рассылка датаграмм всем сокетам воркеров в общем каталоге"""
+
+    def __init__(self, directory: str = CACHE_BUS_DIR, name: Optional[str] = None):
+        self.directory = directory
+        self.name = name
+        self.origin = None
+        self._path = None
+        self._socket = None
+        self._sender = None
+        self._thread = None
+
+    def start(self, on_message: OnMessage):
+        # Имя и origin определяются при старте: с fork воркеры создаются после импорта
+        self.origin = uuid.uuid4().hex
+        name = self.name or f"worker-{os.getpid()}"
+        self._path = os.path.join(self.directory, name + ".sock")
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._path)
+        self._thread = threading.Thread(
+            target=self._listen, args=(self._socket, on_message), name="cache-bus", daemon=True
+        )
+        self._thread.start()
+
+    def publish(self, scopes: List[str]):
+        if self._sender is None:
+            self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sender.settimeout(CACHE_BUS_SEND_TIMEOUT)
+        data = _encode(self.origin, scopes)
+        for path in glob.glob(os.path.join(self.directory, "*.sock")):
+            if path == self._path:
+                continue
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Сокет завершившегося воркера
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError:
+                logger.warning("Не удалось отправить инвалидацию в %s", path, exc_info=True)
+
+    def stop(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+
+    def _listen(self, sock: socket.socket, on_message: OnMessage):
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                if self._socket is not sock:
+                    return  # сокет закрыт в stop()
+                logger.warning("Ошибка чтения из шины инвалидации", exc_info=True)
+                continue
+            _dispatch(data, self.origin, on_message)
+
+
+class RedisBus:
+    """Рассылка через Redis pub/sub (или совместимую замену)"""
+
+    CHANNEL = "businesscrm:cache-invalidate"
+
+    def __init__(self, client):
+        self.client = client
+        self.origin = None
+        self._pubsub = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBus":
+        import redis  # необязательная зависимость, нужна только с CACHE_BUS_URL
+        return cls(redis.Redis.from_url(url))
+
+    def start(self, on_message: OnMessage):
+        self.origin = uuid.uuid4().hex
+        self._stopped.clear()
+        self._pubsub = self._subscribe()
+        self._thread = threading.Thread(
+            target=self._listen, args=(on_message,), name="cache-bus", daemon=True
+        )
+        self._thread.start()
+
+    def _subscribe(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.CHANNEL)
+        return pubsub
+
+    def publish(self, scopes: List[str]):
+        try:
+            self.client.publish(self.CHANNEL, _encode(self.origin, scopes))
+        except Exception:
+            logger.warning("Не удалось отправить инвалидацию в Redis", exc_info=True)
+
+    def stop(self):
+        self._stopped.set()
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+    def _listen(self, on_message: OnMessage):
+        """Слушать канал, переподписываясь после любого сбоя, пока шина не остановлена"""
+        pubsub = self._pubsub
+        while not self._stopped.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self._pubsub = self._subscribe()
+                    # За время разрыва инвалидации могли потеряться - сбросить всё
+                    logger.info("Подписка на шину инвалидации восстановлена")
+                    on_message(None)
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        _dispatch(message["data"], self.origin, on_message)
+            except Exception:
+                if self._stopped.is_set():
+                    return
+                logger.warning("Подписка на шину инвалидации прервалась, переподключение", exc_info=True)
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            pubsub = None
+            self._stopped.wait(CACHE_BUS_RECONNECT_SECONDS)
+
+
+def _dispatch(data: bytes, own_origin: str, on_message: OnMessage):
+    try:
+        message = json.loads(data)
+    except ValueError:
+        logger.warning("Некорректное сообщение шины инвалидации: %r", data[:100])
+        return
+    if message.get("origin") == own_origin:
+        return
+    try:
+        on_message(message.get("scopes", []))
+    except Exception:
+        # Ошибка обработчика не должна останавливать поток шины
+        logger.exception("Не удалось применить инвалидацию")
+
+
+def create_bus():
+    """Шина по настройкам: Redis при заданном CACHE_BUS_URL, иначе Unix-сокеты"""
+    if CACHE_BUS_URL:
+        return RedisBus.from_url(CACHE_BUS_URL)
+    return UnixSocketBus()
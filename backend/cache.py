@@ -0,0 +1,227 @@
+﻿"""Кэширование ответов: счётчики версий данных, слабые ETag и LRU-кэш тел ответов"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from . import bus
+from .auth import decode_token_email
+
+# Настройки кэша ответов
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 512
+RESPONSE_CACHE_MAX_BYTES = 8 * 1024 * 1024  # общий объём тел ответов
+RESPONSE_CACHE_MAX_ENTRY_BYTES = 512 * 1024  # ответы крупнее не кэшируются
+# ETag меняется не реже этого интервала: потерянная инвалидация от другого
+# воркера не оставит устаревший ответ (и 304 на него) дольше
+RESPONSE_CACHE_MAX_AGE_SECONDS = 60
+
+# Области версий
+USERS_SCOPE = "users"  # список сотрудников, профили, статистика по пользователям
+CLIENTS_SCOPE = "clients"  # общее число клиентов для статистики
+
+def clients_scope(email: str) -> str:
+    """Область версий клиентов одного владельца"""
+    return f"clients:{email}"
+
+
+class VersionRegistry:
+    """Счётчики версий данных, которые увеличивают изменяющие маршруты"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self.new_epoch()
+
+    def new_epoch(self):
+        """Сменить эпоху: все выданные ранее ETag перестают совпадать
+
+        Счётчики живут в памяти процесса, поэтому ETag прошлого запуска или
+        другого воркера не должен совпасть. Вызывается и при старте воркера:
+        с fork после импорта эпоха, созданная при импорте, у всех одинаковая.
+        """
+        with self._lock:
+            self._epoch = uuid.uuid4().hex[:8]
+
+    def get(self, scope: str) -> int:
+        with self._lock:
+            return self._versions.get(scope, 0)
+
+    def bump(self, *scopes: str):
+        """Отметить изменение данных в указанных областях"""
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def etag(self, key: str, scopes: List[str]) -> str:
+        """Слабый ETag для ключа ответа по версиям областей и окну RESPONSE_CACHE_MAX_AGE_SECONDS"""
+        window = int(time.time() // RESPONSE_CACHE_MAX_AGE_SECONDS)
+        with self._lock:
+            parts = [f"{scope}={self._versions.get(scope, 0)}" for scope in scopes]
+            epoch = self._epoch
+        digest = hashlib.sha1("|".join([key, str(window)] + parts).encode("utf-8")).hexdigest()[:20]
+        return f'W/"{epoch}-{digest}"'
+
+
+class ResponseCache:
+    """LRU-кэш тел ответов с ограничением по числу записей и объёму"""
+
+    def __init__(self, max_entries: int, max_bytes: int, max_entry_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._size = 0
+
+    def get(self, key: str, etag: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != etag:
+                # Данные изменились - устаревшая запись больше не нужна
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, etag: str, body: bytes):
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (etag, body)
+            self._size += len(body)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._size > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key: str):
+        _, body = self._entries.pop(key)
+        self._size -= len(body)
+
+
+versions = VersionRegistry()
+response_cache = ResponseCache(
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_ENTRY_BYTES
+)
+invalidation_bus = bus.create_bus()
+
+def invalidate(*scopes: str):
+    """Отметить изменение данных локально и разослать инвалидацию остальным воркерам"""
+    versions.bump(*scopes)
+    invalidation_bus.publish(list(scopes))
+
+def _on_invalidation(scopes: Optional[List[str]]):
+    if scopes is None:
+        # Шина переподключилась и могла потерять сообщения
+        versions.new_epoch()
+        response_cache.clear()
+    else:
+        versions.bump(*scopes)
+
+def start_bus():
+    """Принимать инвалидации от других воркеров
+
+    ETag содержит эпоху процесса, поэтому разные воркеры никогда не выдают
+    друг за друга 304; достаточно, чтобы каждый вовремя сбрасывал свои версии.
+    """
+    versions.new_epoch()
+    invalidation_bus.start(_on_invalidation)
+
+def stop_bus():
+    invalidation_bus.stop()
+
+# Кэшируемые GET-маршруты: путь -> (области версий по email, проверка доступа по email)
+_cached_routes: Dict[str, Tuple[Callable[[str], List[str]], Optional[Callable[[str], bool]]]] = {}
+
+def register(
+    path: str,
+    scopes: Callable[[str], List[str]],
+    authorize: Optional[Callable[[str], bool]] = None
+):
+    """Включить условные GET-запросы и кэширование для маршрута
+
+    authorize(email) вызывается перед ответом 304 или телом из кэша: права,
+    отозванные после кэширования, не должны пропускать к сохранённому ответу.
+    """
+    _cached_routes[path] = (scopes, authorize)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Для If-None-Match используется слабое сравнение
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in candidates or etag[2:] in candidates
+
+def _request_email(request: Request) -> Optional[str]:
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return decode_token_email(token)
+
+
+class ConditionalGetMiddleware(BaseHTTPMiddleware):
+    """Отвечает 304 или телом из кэша до того, как маршрут обратится к базе"""
+
+    async def dispatch(self, request: Request, call_next):
+        route = _cached_routes.get(request.url.path) if request.method == "GET" else None
+        if route is None:
+            return await call_next(request)
+        scopes, authorize = route
+
+        email = _request_email(request)
+        if email is None:
+            # Маршрут сам ответит 401
+            return await call_next(request)
+        if authorize is not None and not await run_in_threadpool(authorize, email):
+            # Маршрут сам ответит 403
+            return await call_next(request)
+
+        key = f"{request.url.path}?{request.url.query}|{email}"
+        etag = versions.etag(key, scopes(email))
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+            "Vary": "Authorization",
+        }
+
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        if RESPONSE_CACHE_ENABLED:
+            body = response_cache.get(key, etag)
+            if body is not None:
+                return Response(content=body, media_type="application/json", headers=headers)
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        if RESPONSE_CACHE_ENABLED:
+            response_cache.put(key, etag, body)
+
+        response_headers = {
+            name: value for name, value in response.headers.items() if name != "content-length"
+        }
+        response_headers.update(headers)
+        return Response(content=body, status_code=200, headers=response_headers)
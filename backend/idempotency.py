@@ -0,0 +1,111 @@
+﻿"""Хранилище ключей Idempotency-Key для безопасных повторов POST-запросов
+
+Ключи хранятся в таблице idempotency_keys с уникальным (scope, key), поэтому
+повтор, попавший на другой воркер, тоже получит первый ответ. Ключ
+вставляется в той же транзакции, что и создаваемая запись: если первый
+запрос упал, вместе с ним откатывается и ключ, а параллельный дубль ждёт
+его завершения на уникальном индексе.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Настройки хранилища ключей
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def fingerprint(payload: Any) -> str:
+    """Отпечаток тела запроса: повтор с тем же ключом должен нести то же тело"""
+    data = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:32]
+
+
+class IdempotencyStore:
+    """Ключи с TTL в общей таблице; просроченные удаляются при резервировании новых"""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+
+    def begin(self, db: Session, scope: str, key: str, request_fingerprint: str) -> Optional[Dict]:
+        """Зарезервировать ключ в текущей транзакции (без commit)
+
+        Возвращает сохранённый ответ, если запрос с этим ключом уже выполнен.
+        """
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(
+                status_code=400,
+                detail="Слишком длинный Idempotency-Key"
+            )
+
+        stored = self._stored_response(db, scope, key, request_fingerprint)
+        if stored is not None:
+            return stored
+
+        table = models.IdempotencyKey.__table__
+        now = datetime.utcnow()
+        try:
+            db.execute(table.delete().where(table.c.expires_at < now))
+            db.execute(table.insert().values(
+                scope=scope,
+                key=key,
+                fingerprint=request_fingerprint,
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl_seconds)
+            ))
+            return None
+        except IntegrityError:
+            # Параллельный запрос с тем же ключом успел завершиться
+            db.rollback()
+        except OperationalError:
+            # Параллельный запрос с тем же ключом всё ещё держит транзакцию
+            db.rollback()
+            raise HTTPException(
+                status_code=409,
+                detail="Запрос с этим Idempotency-Key ещё выполняется"
+            )
+        return self._stored_response(db, scope, key, request_fingerprint)
+
+    def complete(self, db: Session, scope: str, key: str, response: Dict):
+        """Сохранить ответ для последующих повторов (без commit - вместе с самой записью)"""
+        table = models.IdempotencyKey.__table__
+        db.execute(
+            table.update()
+            .where(table.c.scope == scope, table.c.key == key)
+            .values(response=response)
+        )
+
+    def release(self, db: Session, scope: str, key: str):
+        """Снять резерв после неудачного выполнения: ключ откатывается вместе с транзакцией"""
+        db.rollback()
+
+    def _stored_response(
+        self, db: Session, scope: str, key: str, request_fingerprint: str
+    ) -> Optional[Dict]:
+        table = models.IdempotencyKey.__table__
+        entry = db.execute(
+            select(table.c.fingerprint, table.c.response).where(
+                table.c.scope == scope,
+                table.c.key == key,
+                table.c.expires_at >= datetime.utcnow()
+            )
+        ).first()
+        if entry is None:
+            return None
+        if entry.fingerprint != request_fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key уже использован с другим телом запроса"
+            )
+        return entry.response
+
+
+store = IdempotencyStore(IDEMPOTENCY_TTL_SECONDS)
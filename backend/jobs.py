@@ -0,0 +1,355 @@
+﻿"""Фоновые задачи: постоянная очередь в таблице jobs и пул рабочих потоков
+
+Долгие админские операции ставятся в очередь через enqueue() и выполняются
+вне запроса. Задачи переживают перезапуск: зависшие после падения процесса
+задачи (без пульса дольше JOB_STALE_SECONDS) снова попадают в очередь.
+Проверка выполняется периодически, поэтому обработчик долгой задачи должен
+регулярно вызывать context.progress() или context.heartbeat(). Там же
+ставятся в очередь периодические задачи, зарегистрированные через schedule().
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import JSON, Boolean, DateTime, Integer, String, exists, literal, or_, select
+from sqlalchemy.orm import Session
+
+from . import models, database
+
+logger = logging.getLogger(__name__)
+
+# Настройки фоновых задач
+JOB_WORKERS = 2
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY_SECONDS = 30  # задержка растёт с каждой попыткой
+JOB_POLL_INTERVAL_SECONDS = 2
+JOB_STALE_SECONDS = 300
+JOB_MAINTENANCE_INTERVAL_SECONDS = 60  # проверка зависших и периодических задач
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+_handlers: Dict[str, Callable] = {}
+_schedules: Dict[str, Tuple[int, dict]] = {}
+
+
+class JobCancelled(Exception):
+    """Задача отменена пользователем"""
+
+
+class JobFailed(Exception):
+    """Ошибка, которую бесполезно повторять: задача сразу завершается неудачей"""
+
+
+def handler(job_type: str):
+    """Зарегистрировать обработчик задачи: fn(context, db, params) -> result"""
+    def decorator(fn: Callable):
+        _handlers[job_type] = fn
+        return fn
+    return decorator
+
+
+def schedule(job_type: str, interval_seconds: int, params: Optional[dict] = None):
+    """Ставить задачу в очередь раз в interval_seconds, если она не ждёт и не выполняется"""
+    _schedules[job_type] = (interval_seconds, params or {})
+
+
+class JobContext:
+    """Доступ обработчика к прогрессу и отмене своей задачи"""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.cancellable = True
+
+    def disallow_cancel(self):
+        """Дальше задача выполняется до конца: запрошенная отмена игнорируется"""
+        self.cancellable = False
+
+    def progress(self, percent: int, message: Optional[str] = None):
+        """Сохранить прогресс (обновляет и пульс задачи); бросает JobCancelled при отмене"""
+        db = database.SessionLocal()
+        try:
+            job = db.get(models.Job, self.job_id)
+            job.progress = max(0, min(100, percent))
+            if message is not None:
+                job.progress_message = message
+            job.heartbeat_at = datetime.utcnow()
+            cancel_requested = job.cancel_requested
+            db.commit()
+        finally:
+            db.close()
+        if cancel_requested and self.cancellable:
+            raise JobCancelled()
+
+    def heartbeat(self):
+        """Обновить пульс без изменения прогресса; бросает JobCancelled при отмене"""
+        db = database.SessionLocal()
+        try:
+            job = db.get(models.Job, self.job_id)
+            job.heartbeat_at = datetime.utcnow()
+            cancel_requested = job.cancel_requested
+            db.commit()
+        finally:
+            db.close()
+        if cancel_requested and self.cancellable:
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        db = database.SessionLocal()
+        try:
+            cancel_requested = db.query(models.Job.cancel_requested).filter(
+                models.Job.id == self.job_id
+            ).scalar()
+        finally:
+            db.close()
+        if cancel_requested and self.cancellable:
+            raise JobCancelled()
+
+
+def enqueue(
+    db: Session,
+    job_type: str,
+    params: Optional[dict] = None,
+    created_by_id: Optional[int] = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS
+) -> models.Job:
+    """Поставить задачу в очередь"""
+    if job_type not in _handlers:
+        raise ValueError(f"Неизвестный тип задачи: {job_type}")
+    job = models.Job(
+        type=job_type,
+        params=params or {},
+        created_by_id=created_by_id,
+        max_attempts=max_attempts
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    runner.wake()
+    return job
+
+
+def _insert_unless(db: Session, job_type: str, params: dict, created_by_id: Optional[int], blocking) -> bool:
+    """Вставить задачу, если нет задачи этого типа, подходящей под blocking
+
+    Проверка и вставка - один INSERT ... SELECT WHERE NOT EXISTS, поэтому
+    несколько воркеров не создадут дубль.
+    """
+    table = models.Job.__table__
+    row = select(
+        literal(job_type, String),
+        literal("queued", String),
+        literal(params, JSON),
+        literal(0, Integer),
+        literal(0, Integer),
+        literal(JOB_MAX_ATTEMPTS, Integer),
+        literal(False, Boolean),
+        literal(datetime.utcnow(), DateTime),
+        literal(created_by_id, Integer)
+    ).where(~exists().where(table.c.type == job_type, blocking))
+    inserted = db.execute(table.insert().from_select([
+        "type", "status", "params", "progress", "attempts", "max_attempts",
+        "cancel_requested", "created_at", "created_by_id"
+    ], row)).rowcount
+    db.commit()
+    return bool(inserted)
+
+
+def enqueue_unique(
+    db: Session,
+    job_type: str,
+    params: Optional[dict] = None,
+    created_by_id: Optional[int] = None
+) -> models.Job:
+    """Поставить задачу в очередь, если задача этого типа ещё не ждёт и не выполняется
+
+    Возвращает новую задачу или уже активную.
+    """
+    if job_type not in _handlers:
+        raise ValueError(f"Неизвестный тип задачи: {job_type}")
+    _insert_unless(
+        db, job_type, params or {}, created_by_id, models.Job.status.in_(ACTIVE_STATUSES)
+    )
+    runner.wake()
+    return db.query(models.Job).filter(models.Job.type == job_type).order_by(models.Job.id.desc()).first()
+
+
+def cancel(db: Session, job: models.Job) -> models.Job:
+    """Отменить задачу: ожидающая отменяется сразу, выполняющаяся - при следующей проверке"""
+    if job.status == "queued":
+        job.status = "cancelled"
+        job.finished_at = datetime.utcnow()
+    elif job.status == "running":
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+class JobRunner:
+    """Пул потоков, забирающих задачи из таблицы jobs"""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._sweep_lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        self._next_sweep = 0.0
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _maintain(self):
+        """Раз в JOB_MAINTENANCE_INTERVAL_SECONDS (одним потоком): зависшие и периодические задачи"""
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + JOB_MAINTENANCE_INTERVAL_SECONDS
+            self._requeue_stale()
+            self._enqueue_scheduled()
+        except Exception:
+            logger.exception("Не удалось проверить зависшие и периодические задачи")
+        finally:
+            self._sweep_lock.release()
+
+    def _enqueue_scheduled(self):
+        db = database.SessionLocal()
+        try:
+            for job_type, (interval_seconds, params) in _schedules.items():
+                recent = datetime.utcnow() - timedelta(seconds=interval_seconds)
+                _insert_unless(db, job_type, params, None, or_(
+                    models.Job.status.in_(ACTIVE_STATUSES), models.Job.created_at >= recent
+                ))
+        finally:
+            db.close()
+
+    def _requeue_stale(self):
+        """Вернуть в очередь задачи, оставшиеся в running после падения процесса"""
+        db = database.SessionLocal()
+        try:
+            stale_before = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+            db.query(models.Job).filter(
+                models.Job.status == "running",
+                or_(models.Job.heartbeat_at.is_(None), models.Job.heartbeat_at < stale_before)
+            ).update({"status": "queued"}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _work(self):
+        while not self._stop.is_set():
+            self._maintain()
+            job_id = self._claim()
+            if job_id is None:
+                self._wakeup.wait(JOB_POLL_INTERVAL_SECONDS)
+                # При остановке событие не сбрасываем, чтобы проснулись все потоки
+                if not self._stop.is_set():
+                    self._wakeup.clear()
+                continue
+            self._run(job_id)
+
+    def _claim(self) -> Optional[int]:
+        db = database.SessionLocal()
+        try:
+            now = datetime.utcnow()
+            candidates = db.query(models.Job.id).filter(
+                models.Job.status == "queued",
+                or_(models.Job.run_after.is_(None), models.Job.run_after <= now)
+            ).order_by(models.Job.id).limit(self.workers).all()
+            for (job_id,) in candidates:
+                # Атомарный захват: задачу получит только один поток или процесс
+                claimed = db.query(models.Job).filter(
+                    models.Job.id == job_id, models.Job.status == "queued"
+                ).update({
+                    "status": "running",
+                    "attempts": models.Job.attempts + 1,
+                    "started_at": now,
+                    "heartbeat_at": now
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    return job_id
+            return None
+        finally:
+            db.close()
+
+    def _run(self, job_id: int):
+        db = database.SessionLocal()
+        try:
+            job = db.get(models.Job, job_id)
+            fn = _handlers.get(job.type)
+            try:
+                if fn is None:
+                    raise RuntimeError(f"Нет обработчика для задачи {job.type}")
+                result = fn(JobContext(job_id), db, job.params or {})
+            except JobCancelled:
+                db.rollback()
+                self._finish(job_id, "cancelled")
+            except JobFailed as error:
+                db.rollback()
+                logger.warning("Задача %s (%s) не может быть выполнена: %s", job_id, job.type, error)
+                self._fail(job_id, str(error), retry=False)
+            except Exception:
+                db.rollback()
+                logger.exception("Задача %s (%s) завершилась с ошибкой", job_id, job.type)
+                self._fail(job_id, traceback.format_exc(limit=5))
+            else:
+                self._finish(job_id, "succeeded", result)
+        finally:
+            db.close()
+
+    def _finish(self, job_id: int, status: str, result=None):
+        db = database.SessionLocal()
+        try:
+            job = db.get(models.Job, job_id)
+            job.status = status
+            job.result = result
+            if status == "succeeded":
+                job.progress = 100
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail(self, job_id: int, error: str, retry: bool = True):
+        db = database.SessionLocal()
+        try:
+            job = db.get(models.Job, job_id)
+            job.error = error
+            if retry and job.attempts < job.max_attempts and not job.cancel_requested:
+                job.status = "queued"
+                job.run_after = datetime.utcnow() + timedelta(
+                    seconds=JOB_RETRY_DELAY_SECONDS * job.attempts
+                )
+            else:
+                job.status = "failed"
+                job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+
+runner = JobRunner()
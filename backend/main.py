@@ -1,13 +1,30 @@
+import time
+#     -      
+STARTED_AT = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import auth, clients, admin_routes
-from .database import engine
-from . import models
+from .routes import auth, clients, admin_routes, health
+from . import cache, jobs
+
+#    (python -m backend.migrate),    
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #        ,   
+    cache.start_bus()
+    if health.warm_up(STARTED_AT):
+        jobs.runner.start()
+    yield
+    health.mark_stopping()
+    jobs.runner.stop()
+    cache.stop_bus()
 
-#  
-models.Base.metadata.create_all(bind=engine)
+app = FastAPI(title="BusinessCRM API", version="1.0.0", lifespan=lifespan)
 
-app = FastAPI(title="BusinessCRM API", version="1.0.0")
+#  GET- (ETag/304)   ; CORS  ,     304
+app.add_middleware(cache.ConditionalGetMiddleware)
 
 #   CORS
 app.add_middleware(
@@ -19,13 +36,16 @@ app.add_middleware(
         "https://127.0.0.1:5173"
     ],
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=[
         "accept",
         "accept-encoding",
         "authorization",
         "content-type",
         "dnt",
+        "idempotency-key",
+        "if-match",
+        "if-none-match",
         "origin",
         "user-agent",
         "x-csrftoken",
@@ -38,6 +58,7 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(clients.router)
 app.include_router(admin_routes.router, tags=["admin"])
+app.include_router(health.router)
 
 @app.get("/")
 def read_root():
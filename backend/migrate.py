@@ -0,0 +1,11 @@
+﻿"""Применение миграций схемы: python -m backend.migrate"""
+from . import migrations
+from .database import engine
+
+if __name__ == "__main__":
+    applied = migrations.upgrade(engine)
+    if applied:
+        for name in applied:
+            print(f"Применена миграция {name}")
+    else:
+        print("Схема базы данных актуальна")
@@ -0,0 +1,83 @@
+﻿"""Исходная схема: пользователи, клиенты, уведомления, организации, журнал, подписки
+
+Таблицы создаются с checkfirst, поэтому существующие базы просто получают
+отметку о версии.
+"""
+from sqlalchemy import (
+    JSON, Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text
+)
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    Table(
+        "users", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("email", String, unique=True, index=True),
+        Column("name", String, nullable=False),
+        Column("hashed_password", String),
+        Column("role", String),
+        Column("status", String),
+        Column("permissions", JSON),
+        Column("last_login", DateTime, nullable=True),
+        Column("created_at", DateTime),
+        Column("updated_at", DateTime),
+        Column("created_by_id", Integer, ForeignKey("users.id"), nullable=True),
+    )
+    Table(
+        "clients", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("name", String, index=True),
+        Column("phone", String),
+        Column("note", Text),
+        Column("status", String),
+        Column("created_at", DateTime),
+        Column("updated_at", DateTime),
+        Column("owner_id", Integer, ForeignKey("users.id")),
+    )
+    Table(
+        "notifications", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("type", String),
+        Column("message", String),
+        Column("details", Text, nullable=True),
+        Column("read", Boolean),
+        Column("created_at", DateTime),
+    )
+    Table(
+        "organizations", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("name", String),
+        Column("subscription_plan", String),
+        Column("subscription_status", String),
+        Column("subscription_expires_at", DateTime),
+        Column("max_users", Integer),
+        Column("created_at", DateTime),
+        Column("settings", JSON),
+    )
+    Table(
+        "activity_logs", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("user_id", Integer, ForeignKey("users.id")),
+        Column("action", String),
+        Column("target_type", String),
+        Column("target_id", Integer, nullable=True),
+        Column("description", String),
+        Column("ip_address", String, nullable=True),
+        Column("user_agent", String, nullable=True),
+        Column("created_at", DateTime),
+    )
+    Table(
+        "subscriptions", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("organization_id", Integer, ForeignKey("organizations.id")),
+        Column("plan", String),
+        Column("status", String),
+        Column("starts_at", DateTime),
+        Column("expires_at", DateTime),
+        Column("max_users", Integer),
+        Column("price", Integer),
+        Column("created_at", DateTime),
+    )
+    metadata.create_all(connection, checkfirst=True)
@@ -0,0 +1,17 @@
+﻿"""Дневные сводки журнала активности"""
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table, UniqueConstraint
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "activity_log_daily", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("day", String, index=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=True),
+        Column("action", String),
+        Column("count", Integer),
+        UniqueConstraint("day", "user_id", "action"),
+    )
+    metadata.tables["activity_log_daily"].create(connection, checkfirst=True)
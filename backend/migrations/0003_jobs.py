@@ -0,0 +1,30 @@
+﻿"""Очередь фоновых задач"""
+from sqlalchemy import (
+    JSON, Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text
+)
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "jobs", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("type", String, index=True),
+        Column("status", String, index=True),
+        Column("params", JSON),
+        Column("result", JSON, nullable=True),
+        Column("error", Text, nullable=True),
+        Column("progress", Integer),
+        Column("progress_message", String, nullable=True),
+        Column("attempts", Integer),
+        Column("max_attempts", Integer),
+        Column("cancel_requested", Boolean),
+        Column("run_after", DateTime, nullable=True),
+        Column("heartbeat_at", DateTime, nullable=True),
+        Column("started_at", DateTime, nullable=True),
+        Column("finished_at", DateTime, nullable=True),
+        Column("created_at", DateTime),
+        Column("created_by_id", Integer, ForeignKey("users.id"), nullable=True),
+    )
+    metadata.tables["jobs"].create(connection, checkfirst=True)
@@ -0,0 +1,66 @@
+﻿"""История статусов клиентов и дневные агрегаты воронки и когорт
+
+Существующие клиенты получают запись о создании в текущем статусе, а
+агрегаты заполняются по ним одним проходом.
+"""
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Integer, MetaData, String, Table, UniqueConstraint, text
+)
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    Table("users", metadata, Column("id", Integer, primary_key=True))
+    Table(
+        "client_status_history", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("client_id", Integer, index=True),
+        Column("owner_id", Integer, ForeignKey("users.id")),
+        Column("from_status", String, nullable=True),
+        Column("to_status", String),
+        Column("changed_by_id", Integer, ForeignKey("users.id"), nullable=True),
+        Column("changed_at", DateTime),
+    )
+    Table(
+        "client_funnel_daily", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("day", String, index=True),
+        Column("owner_id", Integer, ForeignKey("users.id")),
+        Column("status", String),
+        Column("entered", Integer),
+        Column("exited", Integer),
+        Column("time_in_stage_seconds", Integer),
+        UniqueConstraint("day", "owner_id", "status"),
+    )
+    Table(
+        "client_cohort_daily", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("cohort_day", String, index=True),
+        Column("owner_id", Integer, ForeignKey("users.id")),
+        Column("status", String),
+        Column("created", Integer),
+        Column("reached", Integer),
+        UniqueConstraint("cohort_day", "owner_id", "status"),
+    )
+    for name in ["client_status_history", "client_funnel_daily", "client_cohort_daily"]:
+        metadata.tables[name].create(connection, checkfirst=True)
+
+    connection.execute(text("""
+        INSERT INTO client_status_history (client_id, owner_id, from_status, to_status, changed_at)
+        SELECT id, owner_id, NULL, status, created_at FROM clients
+        WHERE status IS NOT NULL
+          AND id NOT IN (SELECT client_id FROM client_status_history)
+    """))
+    connection.execute(text("""
+        INSERT OR IGNORE INTO client_funnel_daily
+            (day, owner_id, status, entered, exited, time_in_stage_seconds)
+        SELECT date(created_at), owner_id, status, COUNT(*), 0, 0 FROM clients
+        WHERE status IS NOT NULL AND date(created_at) IS NOT NULL
+        GROUP BY date(created_at), owner_id, status
+    """))
+    connection.execute(text("""
+        INSERT OR IGNORE INTO client_cohort_daily (cohort_day, owner_id, status, created, reached)
+        SELECT date(created_at), owner_id, status, COUNT(*), COUNT(*) FROM clients
+        WHERE status IS NOT NULL AND date(created_at) IS NOT NULL
+        GROUP BY date(created_at), owner_id, status
+    """))
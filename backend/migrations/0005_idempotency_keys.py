@@ -0,0 +1,18 @@
+﻿"""Общая для воркеров таблица ключей Idempotency-Key"""
+from sqlalchemy import JSON, Column, DateTime, Integer, MetaData, String, Table, UniqueConstraint
+
+
+def upgrade(connection):
+    metadata = MetaData()
+    Table(
+        "idempotency_keys", metadata,
+        Column("id", Integer, primary_key=True, index=True),
+        Column("scope", String),
+        Column("key", String),
+        Column("fingerprint", String),
+        Column("response", JSON, nullable=True),
+        Column("created_at", DateTime),
+        Column("expires_at", DateTime, index=True),
+        UniqueConstraint("scope", "key"),
+    )
+    metadata.tables["idempotency_keys"].create(connection, checkfirst=True)
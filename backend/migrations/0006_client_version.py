@@ -0,0 +1,12 @@
+﻿"""Счётчик версии клиента для If-Match
+
+updated_at не годится для сравнения: строки, записанные через func.now(),
+хранятся без микросекунд и не совпадают с параметром datetime.
+"""
+from sqlalchemy import text
+
+
+def upgrade(connection):
+    columns = [row[1] for row in connection.execute(text("PRAGMA table_info(clients)"))]
+    if "version" not in columns:
+        connection.execute(text("ALTER TABLE clients ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
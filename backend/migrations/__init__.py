@@ -0,0 +1,62 @@
+﻿"""Версионные миграции схемы базы данных
+
+Каждая миграция - модуль NNNN_описание.py с функцией upgrade(connection).
+Применённые версии хранятся в таблице schema_migrations. Схема больше не
+создаётся при импорте приложения: перед запуском воркеров выполните
+python -m backend.migrate
+"""
+import importlib
+import pkgutil
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.engine import Connection, Engine
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime),
+)
+
+
+def available() -> List[Tuple[int, str]]:
+    """Все миграции пакета: (версия, имя модуля) по возрастанию версии"""
+    migrations = []
+    for module in pkgutil.iter_modules(__path__):
+        prefix = module.name.split("_", 1)[0]
+        if prefix.isdigit():
+            migrations.append((int(prefix), module.name))
+    return sorted(migrations)
+
+
+def applied_versions(connection: Connection) -> set:
+    """Применённые версии; только чтение - без таблицы schema_migrations ничего не применено"""
+    if not inspect(connection).has_table(schema_migrations.name):
+        return set()
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending(engine: Engine) -> List[Tuple[int, str]]:
+    """Миграции, которые ещё не применены к базе (проверка готовности не пишет в базу)"""
+    with engine.connect() as connection:
+        done = applied_versions(connection)
+    return [(version, name) for version, name in available() if version not in done]
+
+
+def upgrade(engine: Engine) -> List[str]:
+    """Применить все недостающие миграции, каждую в своей транзакции"""
+    with engine.begin() as connection:
+        schema_migrations.create(connection, checkfirst=True)
+    applied = []
+    for version, name in pending(engine):
+        module = importlib.import_module(f"{__name__}.{name}")
+        with engine.begin() as connection:
+            module.upgrade(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        applied.append(name)
+    return applied
@@ -1,4 +1,4 @@
-﻿from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text, JSON
+﻿from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -39,11 +39,49 @@ class Client(Base):
     status = Column(String, default="новый")
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # растёт при каждом изменении
     
     # Связи
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="clients")
 
+class ClientStatusHistory(Base):
+    """Журнал смены статусов клиентов (только добавление)"""
+    __tablename__ = "client_status_history"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, index=True)  # без внешнего ключа: история переживает удаление клиента
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    from_status = Column(String, nullable=True)  # None - клиент создан или был без статуса
+    to_status = Column(String)
+    changed_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    changed_at = Column(DateTime, default=func.now())
+
+class ClientFunnelDaily(Base):
+    """Дневные агрегаты воронки: входы и выходы по статусам, время в статусе"""
+    __tablename__ = "client_funnel_daily"
+    __table_args__ = (UniqueConstraint("day", "owner_id", "status"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(String, index=True)  # YYYY-MM-DD
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    status = Column(String)
+    entered = Column(Integer, default=0)
+    exited = Column(Integer, default=0)
+    time_in_stage_seconds = Column(Integer, default=0)  # сумма по выходам из статуса
+
+class ClientCohortDaily(Base):
+    """Когорты клиентов по дню создания: сколько клиентов дошло до каждого статуса"""
+    __tablename__ = "client_cohort_daily"
+    __table_args__ = (UniqueConstraint("cohort_day", "owner_id", "status"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cohort_day = Column(String, index=True)  # YYYY-MM-DD
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    status = Column(String)
+    created = Column(Integer, default=0)  # создано сразу в этом статусе
+    reached = Column(Integer, default=0)  # хотя бы раз побывали в статусе
+
 class Notification(Base):
     __tablename__ = "notifications"
     
@@ -92,6 +130,55 @@ class ActivityLog(Base):
     # Связи
     user = relationship("User")
 
+class ActivityLogDaily(Base):
+    """Дневные сводки журнала активности по действиям и пользователям"""
+    __tablename__ = "activity_log_daily"
+    __table_args__ = (UniqueConstraint("day", "user_id", "action"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(String, index=True)  # YYYY-MM-DD
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    action = Column(String)
+    count = Column(Integer, default=0)
+
+class Job(Base):
+    """Фоновая задача (см. backend/jobs.py)"""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String, index=True)
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed, cancelled
+    params = Column(JSON, default={})
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    progress = Column(Integer, default=0)  # 0-100
+    progress_message = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    cancel_requested = Column(Boolean, default=False)
+    run_after = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    
+    # Связи
+    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_by = relationship("User")
+
+class IdempotencyKey(Base):
+    """Ключ Idempotency-Key и сохранённый ответ (см. backend/idempotency.py)"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("scope", "key"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String)
+    key = Column(String)
+    fingerprint = Column(String)
+    response = Column(JSON, nullable=True)  # заполняется в той же транзакции, что и ключ
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
+
 class Subscription(Base):
     __tablename__ = "subscriptions"
     
@@ -0,0 +1,225 @@
+﻿"""Ограничение частоты попыток входа: token bucket по IP и по учётной записи
+
+Корзины учётной записи только проверяются до bcrypt, а списываются при
+неверном пароле. Строгая корзина привязана к паре учётная запись + IP,
+поэтому перебор с одного адреса не блокирует вход владельцу с другого.
+Общая корзина учётной записи заметно больше и ограничивает перебор одного
+пароля с множества адресов.
+
+По умолчанию корзины хранятся в памяти процесса (LRU с ограничением числа
+ключей). Если задан RATE_LIMIT_STORE_URL (redis://...), счётчики общие для
+всех воркеров; вместо Redis подойдёт любой клиент с get(), incr() и expire().
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Настройки ограничения попыток входа: (размер корзины, пополнение в секунду)
+LOGIN_IP_LIMIT = (20, 20 / 60)  # до 20 попыток подряд, затем 20 в минуту
+LOGIN_ACCOUNT_LIMIT = (5, 5 / 300)  # до 5 неудачных попыток подряд, затем 5 за 5 минут
+LOGIN_ACCOUNT_GLOBAL_LIMIT = (50, 50 / 900)  # со всех адресов: до 50 подряд, затем 50 за 15 минут
+RATE_LIMIT_MAX_KEYS = 100000
+RATE_LIMIT_STORE_URL = os.getenv("RATE_LIMIT_STORE_URL", "")
+TRUST_FORWARDED_FOR = False  # включать только за доверенным прокси
+
+Limit = Tuple[int, float]
+
+
+class MemoryBucketStore:
+    """Корзины в памяти: ключ -> (токены, время последнего пополнения)"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def hit(self, key: str, limit: Limit) -> Optional[float]:
+        """Списать токен; вернуть через сколько секунд повторить, если токенов нет"""
+        capacity, refill = limit
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = None
+            else:
+                retry_after = (1 - tokens) / refill
+            # Полная корзина не отличается от отсутствующей - не храним её
+            if tokens < capacity:
+                self._buckets[key] = (tokens, now)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            return retry_after
+
+    def peek(self, key: str, limit: Limit) -> Optional[float]:
+        """Как hit(), но без списания токена"""
+        capacity, refill = limit
+        now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                return None
+            tokens = min(capacity, entry[0] + (now - entry[1]) * refill)
+            return None if tokens >= 1 else (1 - tokens) / refill
+
+    def reset(self, key: str):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class RedisWindowStore:
+    """Общие для воркеров счётчики фиксированного окна в Redis (или совместимой замене)"""
+
+    PREFIX = "businesscrm:ratelimit:"
+
+    def __init__(self, client):
+        self.client = client
+        self.evictions = 0
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisWindowStore":
+        import redis  # необязательная зависимость, нужна только с RATE_LIMIT_STORE_URL
+        return cls(redis.Redis.from_url(url))
+
+    def _window(self, key: str, limit: Limit) -> Tuple[str, int, float]:
+        capacity, refill = limit
+        window = max(1, math.ceil(capacity / refill))
+        window_start = int(time.time() // window) * window
+        return f"{self.PREFIX}{key}:{window_start}", window, window_start + window
+
+    def hit(self, key: str, limit: Limit) -> Optional[float]:
+        capacity, _ = limit
+        redis_key, window, window_end = self._window(key, limit)
+        try:
+            count = self.client.incr(redis_key)
+            if count == 1:
+                self.client.expire(redis_key, window)
+        except Exception:
+            # Недоступность общего хранилища не должна блокировать вход
+            logger.warning("Не удалось проверить лимит в Redis", exc_info=True)
+            return None
+        if count > capacity:
+            return window_end - time.time()
+        return None
+
+    def peek(self, key: str, limit: Limit) -> Optional[float]:
+        capacity, _ = limit
+        redis_key, _, window_end = self._window(key, limit)
+        try:
+            count = int(self.client.get(redis_key) or 0)
+        except Exception:
+            logger.warning("Не удалось проверить лимит в Redis", exc_info=True)
+            return None
+        if count >= capacity:
+            return window_end - time.time()
+        return None
+
+    def reset(self, key: str):
+        # Счётчики окна истекают сами; сбрасывать их по успешному входу не нужно
+        pass
+
+    def size(self) -> int:
+        return 0
+
+
+def _create_store():
+    if RATE_LIMIT_STORE_URL:
+        return RedisWindowStore.from_url(RATE_LIMIT_STORE_URL)
+    return MemoryBucketStore()
+
+
+store = _create_store()
+metrics: Counter = Counter()
+_metrics_lock = threading.Lock()
+
+
+def _count(outcome: str):
+    with _metrics_lock:
+        metrics[outcome] += 1
+
+
+def client_ip(request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def _account_key(ip: str, email: str) -> str:
+    return f"login:account:{email.strip().lower()}:{ip}"
+
+
+def _account_global_key(email: str) -> str:
+    return f"login:account:{email.strip().lower()}"
+
+
+def check_login(ip: str, email: str) -> Optional[float]:
+    """Проверить лимиты попытки входа до обращения к базе и bcrypt
+
+    Возвращает время ожидания в секундах, если попытку нужно отклонить.
+    """
+    retry_after = store.hit(f"login:ip:{ip}", LOGIN_IP_LIMIT)
+    if retry_after is not None:
+        _count("rejected_ip")
+        return retry_after
+    retry_after = store.peek(_account_key(ip, email), LOGIN_ACCOUNT_LIMIT)
+    if retry_after is not None:
+        _count("rejected_account")
+        return retry_after
+    retry_after = store.peek(_account_global_key(email), LOGIN_ACCOUNT_GLOBAL_LIMIT)
+    if retry_after is not None:
+        _count("rejected_account_global")
+        return retry_after
+    _count("allowed")
+    return None
+
+
+def login_succeeded(ip: str, email: str):
+    """Успешный вход снимает строгое ограничение с учётной записи для этого IP
+
+    Общая корзина не сбрасывается: иначе вход владельца обнулял бы счётчик
+    распределённого перебора.
+    """
+    _count("succeeded")
+    store.reset(_account_key(ip, email))
+
+
+def login_failed(ip: str, email: str):
+    """Неверный пароль списывает токен из обеих корзин учётной записи"""
+    _count("failed")
+    store.hit(_account_key(ip, email), LOGIN_ACCOUNT_LIMIT)
+    store.hit(_account_global_key(email), LOGIN_ACCOUNT_GLOBAL_LIMIT)
+
+
+def render_metrics() -> str:
+    """Счётчики в текстовом формате Prometheus"""
+    lines = [
+        "# HELP crm_login_attempts_total Login attempts by outcome",
+        "# TYPE crm_login_attempts_total counter",
+    ]
+    with _metrics_lock:
+        snapshot = dict(metrics)
+    for outcome in ["allowed", "rejected_ip", "rejected_account", "rejected_account_global", "succeeded", "failed"]:
+        lines.append(f'crm_login_attempts_total{{outcome="{outcome}"}} {snapshot.get(outcome, 0)}')
+    lines += [
+        "# HELP crm_ratelimit_buckets Rate-limit buckets held in memory",
+        "# TYPE crm_ratelimit_buckets gauge",
+        f"crm_ratelimit_buckets {store.size()}",
+        "# HELP crm_ratelimit_evictions_total Buckets evicted to respect RATE_LIMIT_MAX_KEYS",
+        "# TYPE crm_ratelimit_evictions_total counter",
+        f"crm_ratelimit_evictions_total {store.evictions}",
+    ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,279 @@
+﻿"""Хранение журнала активности: дневные сводки и архив в сжатых NDJSON-сегментах
+
+Записи старше срока хранения сворачиваются в activity_log_daily, выгружаются
+в неизменяемые сегменты (gzip или zstd, если установлен zstandard) с небольшим
+индексным файлом рядом и удаляются из таблицы. Чтение журнала прозрачно
+продолжается из сегментов, когда живых записей не хватает.
+
+Архивация ставится в очередь фоновых задач раз в ACTIVITY_ARCHIVE_INTERVAL_SECONDS.
+Запуск вручную: python -m backend.retention
+"""
+import glob
+import gzip
+import io
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Настройки хранения журнала активности
+ACTIVITY_LOG_RETENTION_DAYS = 90
+# Каталог архива не зависит от рабочего каталога процесса: по умолчанию archive/ в корне проекта
+ACTIVITY_ARCHIVE_DIR = os.getenv(
+    "ACTIVITY_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "archive", "activity_logs")
+)
+ACTIVITY_ARCHIVE_INTERVAL_SECONDS = 24 * 60 * 60  # как часто планировщик задач запускает архивацию
+ACTIVITY_ARCHIVE_BATCH_SIZE = 5000  # записей в одном сегменте
+
+INDEX_SUFFIX = ".idx.json"
+ARCHIVE_FIELDS = [
+    "id", "user_id", "action", "target_type", "target_id",
+    "description", "ip_address", "user_agent", "created_at",
+]
+
+
+def _zstandard():
+    """zstd необязателен (по умолчанию gzip) и загружается только при работе с архивом"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _open_segment(path: str, mode: str, codec: Optional[str] = None):
+    codec = codec or ("zst" if path.endswith(".zst") else "gz")
+    if codec == "zst":
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise RuntimeError(f"Для чтения {path} нужен пакет zstandard")
+        if mode == "rb":
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")))
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+    return gzip.open(path, mode)
+
+
+def _segment_indexes(archive_dir: str) -> List[Dict]:
+    """Индексы сегментов от новых к старым; сегмент без индекса не считается записанным"""
+    indexes = []
+    for index_path in glob.glob(os.path.join(archive_dir, "*" + INDEX_SUFFIX)):
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+        index["path"] = index_path[:-len(INDEX_SUFFIX)]
+        indexes.append(index)
+    indexes.sort(key=lambda index: index["last_id"], reverse=True)
+    return indexes
+
+
+def _write_segment(archive_dir: str, rows: List[models.ActivityLog]) -> Dict:
+    os.makedirs(archive_dir, exist_ok=True)
+    codec = "zst" if _zstandard() is not None else "gz"
+    name = f"activity-{rows[0].id:010d}-{rows[-1].id:010d}.ndjson.{codec}"
+    path = os.path.join(archive_dir, name)
+
+    with _open_segment(path + ".tmp", "wb", codec) as f:
+        for row in rows:
+            entry = {field: getattr(row, field) for field in ARCHIVE_FIELDS}
+            if entry["created_at"] is not None:
+                entry["created_at"] = entry["created_at"].isoformat()
+            f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+    os.replace(path + ".tmp", path)
+
+    created = [row.created_at for row in rows if row.created_at is not None]
+    index = {
+        "first_id": rows[0].id,
+        "last_id": rows[-1].id,
+        "count": len(rows),
+        "min_created_at": min(created).isoformat() if created else None,
+        "max_created_at": max(created).isoformat() if created else None,
+        "user_ids": sorted({row.user_id for row in rows if row.user_id is not None}),
+        "actions": sorted({row.action for row in rows if row.action is not None}),
+        "codec": codec,
+    }
+    # Индекс пишется последним: только после него сегмент считается архивированным
+    with open(path + INDEX_SUFFIX + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(path + INDEX_SUFFIX + ".tmp", path + INDEX_SUFFIX)
+    index["segment"] = name
+    return index
+
+
+def _rollup_and_delete(db: Session, first_id: int, last_id: int) -> int:
+    """Добавить записи диапазона в дневные сводки и удалить их одной транзакцией"""
+    rows = db.query(
+        models.ActivityLog.created_at, models.ActivityLog.user_id, models.ActivityLog.action
+    ).filter(
+        models.ActivityLog.id >= first_id, models.ActivityLog.id <= last_id
+    ).all()
+    if not rows:
+        return 0
+
+    counts = Counter(
+        (created_at.strftime("%Y-%m-%d") if created_at else "", user_id, action)
+        for created_at, user_id, action in rows
+    )
+    days = {day for day, _, _ in counts}
+    existing = {
+        (summary.day, summary.user_id, summary.action): summary
+        for summary in db.query(models.ActivityLogDaily).filter(
+            models.ActivityLogDaily.day.in_(days)
+        )
+    }
+    for key, count in counts.items():
+        summary = existing.get(key)
+        if summary is None:
+            day, user_id, action = key
+            db.add(models.ActivityLogDaily(day=day, user_id=user_id, action=action, count=count))
+        else:
+            summary.count += count
+
+    db.query(models.ActivityLog).filter(
+        models.ActivityLog.id >= first_id, models.ActivityLog.id <= last_id
+    ).delete(synchronize_session=False)
+    db.commit()
+    return len(rows)
+
+
+def archive_activity_logs(
+    db: Session,
+    retention_days: int = ACTIVITY_LOG_RETENTION_DAYS,
+    archive_dir: Optional[str] = None,
+    batch_size: int = ACTIVITY_ARCHIVE_BATCH_SIZE,
+    on_segment: Optional[Callable[[int], None]] = None
+) -> Dict:
+    """Свернуть и выгрузить в архив записи журнала старше retention_days
+
+    on_segment(archived) вызывается после каждого записанного сегмента; из
+    него можно прервать архивацию исключением - сегменты атомарны.
+    """
+    archive_dir = archive_dir or ACTIVITY_ARCHIVE_DIR
+    indexes = _segment_indexes(archive_dir)
+    archived_max = indexes[0]["last_id"] if indexes else 0
+
+    # Восстановление после сбоя: сегмент записан, но строки ещё не удалены
+    recovered = 0
+    if archived_max:
+        first_id = db.query(func.min(models.ActivityLog.id)).scalar()
+        if first_id is not None and first_id <= archived_max:
+            recovered = _rollup_and_delete(db, first_id, archived_max)
+
+    # Архивируется только непрерывный по id префикс старых записей. Последняя
+    # запись таблицы не удаляется никогда, иначе SQLite выдаст её id повторно
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    boundary = db.query(func.min(models.ActivityLog.id)).filter(
+        models.ActivityLog.created_at >= cutoff
+    ).scalar()
+    max_id = db.query(func.max(models.ActivityLog.id)).scalar()
+    if max_id is None:
+        return {"archived": 0, "recovered": recovered, "segments": []}
+    upper = min(boundary, max_id) if boundary is not None else max_id
+
+    archived = 0
+    segments = []
+    while True:
+        rows = db.query(models.ActivityLog).filter(
+            models.ActivityLog.id > archived_max, models.ActivityLog.id < upper
+        ).order_by(models.ActivityLog.id).limit(batch_size).all()
+        if not rows:
+            break
+        index = _write_segment(archive_dir, rows)
+        archived += _rollup_and_delete(db, index["first_id"], index["last_id"])
+        archived_max = index["last_id"]
+        segments.append(index["segment"])
+        if on_segment is not None:
+            on_segment(archived)
+
+    return {"archived": archived, "recovered": recovered, "segments": segments}
+
+
+def activity_log_summary(db: Session, since_day: str) -> List[Dict]:
+    """Дневные сводки начиная с since_day: архивные дни из activity_log_daily, свежие - по живой таблице"""
+    counts = Counter()
+    for summary in db.query(models.ActivityLogDaily).filter(models.ActivityLogDaily.day >= since_day):
+        counts[(summary.day, summary.user_id, summary.action)] += summary.count
+
+    day = func.strftime("%Y-%m-%d", models.ActivityLog.created_at)
+    live = db.query(
+        day, models.ActivityLog.user_id, models.ActivityLog.action, func.count(models.ActivityLog.id)
+    ).filter(day >= since_day).group_by(
+        day, models.ActivityLog.user_id, models.ActivityLog.action
+    )
+    # День на границе архива может быть частично в обеих таблицах - складываем
+    for live_day, user_id, action, count in live:
+        counts[(live_day, user_id, action)] += count
+
+    return [
+        {"day": day, "user_id": user_id, "action": action, "count": count}
+        for (day, user_id, action), count in sorted(
+            counts.items(), key=lambda item: item[0][0], reverse=True
+        )
+    ]
+
+
+def iter_archived_logs(
+    archive_dir: Optional[str] = None,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None
+) -> Iterator[Dict]:
+    """Архивные записи от новых к старым; сегменты отсекаются по индексу без распаковки"""
+    for index in _segment_indexes(archive_dir or ACTIVITY_ARCHIVE_DIR):
+        if user_id is not None and user_id not in index["user_ids"]:
+            continue
+        if action is not None and action not in index["actions"]:
+            continue
+        with _open_segment(index["path"], "rb") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in reversed(entries):
+            if user_id is not None and entry["user_id"] != user_id:
+                continue
+            if action is not None and entry["action"] != action:
+                continue
+            yield entry
+
+
+def read_activity_log(
+    db: Session,
+    limit: int = 50,
+    offset: int = 0,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
+    archive_dir: Optional[str] = None
+) -> List:
+    """Страница журнала активности: сначала живая таблица, затем архивные сегменты"""
+    query = db.query(models.ActivityLog)
+    if user_id is not None:
+        query = query.filter(models.ActivityLog.user_id == user_id)
+    if action is not None:
+        query = query.filter(models.ActivityLog.action == action)
+
+    logs = query.order_by(models.ActivityLog.created_at.desc()).offset(offset).limit(limit).all()
+    if len(logs) >= limit:
+        return logs
+
+    # Живых записей не хватило - продолжаем из архива
+    archive_offset = max(0, offset - query.count()) if offset else 0
+    result: List = list(logs)
+    for position, entry in enumerate(iter_archived_logs(archive_dir, user_id, action)):
+        if position < archive_offset:
+            continue
+        result.append(entry)
+        if len(result) >= limit:
+            break
+    return result
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(archive_activity_logs(session))
+    finally:
+        session.close()
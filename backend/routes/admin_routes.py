@@ -1,12 +1,14 @@
-﻿from fastapi import APIRouter, Depends, HTTPException, status
+﻿from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, schemas, database
+from typing import List, Optional
+from .. import models, schemas, database, cache, idempotency, retention, jobs, analytics
 from ..auth import get_current_user, get_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+
 def get_db():
     db = database.SessionLocal()
     try:
@@ -23,6 +25,18 @@ def require_admin(current_user: models.User = Depends(get_current_user)):
         )
     return current_user
 
+def _is_admin(email: str) -> bool:
+    """Проверка админских прав для ответов из кэша"""
+    db = database.SessionLocal()
+    try:
+        role = db.query(models.User.role).filter(models.User.email == email).scalar()
+    finally:
+        db.close()
+    return role in ["admin", "owner"]
+
+cache.register("/admin/staff", lambda email: [cache.USERS_SCOPE], authorize=_is_admin)
+cache.register("/admin/stats", lambda email: [cache.USERS_SCOPE, cache.CLIENTS_SCOPE], authorize=_is_admin)
+
 @router.get("/staff", response_model=List[schemas.UserOut])
 async def get_staff(
     db: Session = Depends(get_db),
@@ -47,40 +61,62 @@ async def get_staff(
 @router.post("/staff", response_model=schemas.UserOut)
 async def create_staff(
     user: schemas.UserCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_admin)
 ):
-    """Создать нового сотрудника"""
-    # Проверяем, что email уникален
-    if db.query(models.User).filter(models.User.email == user.email).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Пользователь с таким email уже существует"
-        )
-    
-    # Создаем пользователя
+    """Создать нового сотрудника (повтор с тем же Idempotency-Key вернёт первый ответ)"""
+    scope = f"staff:{current_user.id}"
+    # Хэш считается до резервирования ключа, чтобы не держать транзакцию на время bcrypt
     hashed_password = get_password_hash(user.password)
-    
-    # Убеждаемся, что permissions - это словарь
-    permissions = user.permissions if user.permissions else {
-        "canAddClients": True,
-        "canEditClients": True,
-        "canDeleteClients": False,
-        "canViewReports": True,
-        "canExportData": False
-    }
-    
-    db_user = models.User(
-        email=user.email,
-        name=user.name,
-        hashed_password=hashed_password,
-        role=user.role if hasattr(user, 'role') else "staff",
-        permissions=permissions,
-        created_by_id=current_user.id if hasattr(models.User, 'created_by_id') else None
-    )
-    
-    db.add(db_user)
-    db.commit()
+    if idempotency_key:
+        replayed = idempotency.store.begin(
+            db, scope, idempotency_key, idempotency.fingerprint(user.dict())
+        )
+        if replayed is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return replayed
+
+    try:
+        # Проверяем, что email уникален
+        if db.query(models.User).filter(models.User.email == user.email).first():
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Пользователь с таким email уже существует"
+            )
+        
+        # Убеждаемся, что permissions - это словарь
+        permissions = user.permissions if user.permissions else {
+            "canAddClients": True,
+            "canEditClients": True,
+            "canDeleteClients": False,
+            "canViewReports": True,
+            "canExportData": False
+        }
+        
+        db_user = models.User(
+            email=user.email,
+            name=user.name,
+            hashed_password=hashed_password,
+            role=user.role if hasattr(user, 'role') else "staff",
+            permissions=permissions,
+            created_by_id=current_user.id if hasattr(models.User, 'created_by_id') else None
+        )
+        
+        db.add(db_user)
+        db.flush()
+        if idempotency_key:
+            idempotency.store.complete(
+                db, scope, idempotency_key,
+                jsonable_encoder(schemas.UserOut.model_validate(db_user))
+            )
+        db.commit()
+    except Exception:
+        if idempotency_key:
+            idempotency.store.release(db, scope, idempotency_key)
+        raise
+    cache.invalidate(cache.USERS_SCOPE)
     db.refresh(db_user)
     
     # Логируем действие
@@ -123,6 +159,7 @@ async def update_staff_role(
         staff.updated_at = datetime.utcnow()
     
     db.commit()
+    cache.invalidate(cache.USERS_SCOPE)
     
     # Логируем действие
     log_activity(
@@ -136,7 +173,10 @@ async def update_staff_role(
     
     return {"message": "Роль успешно изменена"}
 
-@router.delete("/staff/{staff_id}")
+# Размер пачки при переназначении клиентов удаляемого сотрудника
+REASSIGN_BATCH_SIZE = 500
+
+@router.delete("/staff/{staff_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_staff(
     staff_id: int,
     db: Session = Depends(get_db),
@@ -157,27 +197,67 @@ async def delete_staff(
             detail="Нельзя удалить самого себя"
         )
     
+    # Переназначение клиентов и удаление выполняются фоновой задачей
+    job = jobs.enqueue(
+        db,
+        "delete_staff",
+        {"staff_id": staff_id, "admin_id": current_user.id},
+        created_by_id=current_user.id
+    )
+    
+    return {"message": "Удаление сотрудника запущено", "job_id": job.id}
+
+@jobs.handler("delete_staff")
+def delete_staff_job(context: jobs.JobContext, db: Session, params: dict):
+    """Переназначить клиентов сотрудника на администратора пачками и удалить сотрудника"""
+    staff = db.get(models.User, params["staff_id"])
+    admin = db.get(models.User, params["admin_id"])
+    if staff is None:
+        return {"reassigned": 0}
+    if admin is None:
+        raise jobs.JobFailed(f"Администратор {params['admin_id']} не найден: некому передать клиентов")
+    
     # Переназначаем клиентов удаляемого сотрудника на администратора
+    reassigned = 0
+    context.check_cancelled()
+    # История и агрегаты воронки переносятся после всех пачек: отмена посередине
+    # оставила бы их у удаляемого сотрудника, поэтому дальше задача не отменяется
+    context.disallow_cancel()
     if hasattr(models, 'Client'):
-        clients_to_reassign = db.query(models.Client).filter(models.Client.owner_id == staff_id).all()
-        for client in clients_to_reassign:
-            client.owner_id = current_user.id
-    
+        total = db.query(models.Client).filter(models.Client.owner_id == staff.id).count()
+        while True:
+            client_ids = [client_id for (client_id,) in db.query(models.Client.id).filter(
+                models.Client.owner_id == staff.id
+            ).limit(REASSIGN_BATCH_SIZE).all()]
+            if not client_ids:
+                break
+            db.query(models.Client).filter(models.Client.id.in_(client_ids)).update(
+                {"owner_id": admin.id, "version": models.Client.version + 1}, synchronize_session=False
+            )
+            db.commit()
+            reassigned += len(client_ids)
+            cache.invalidate(cache.clients_scope(staff.email), cache.clients_scope(admin.email))
+            context.progress(reassigned * 100 // max(total, 1), f"Переназначено клиентов: {reassigned}")
+    
+    staff_id = staff.id
     staff_name = staff.name
+    # История и агрегаты воронки переходят к новому владельцу вместе с клиентами
+    analytics.reassign_owner(db, staff_id, admin.id)
     db.delete(staff)
     db.commit()
+    cache.invalidate(cache.USERS_SCOPE)
     
     # Логируем действие
     log_activity(
         db=db,
-        user_id=current_user.id,
+        user_id=admin.id,
         action="delete",
         target_type="user",
         target_id=staff_id,
-        description=f"Удален сотрудник: {staff_name}. Клиенты переназначены на {current_user.name}"
+        description=f"Удален сотрудник: {staff_name}. Клиенты переназначены на {admin.name}"
     )
     
-    return {"message": "Сотрудник успешно удален"}
+    return {"reassigned": reassigned}
 
 @router.put("/staff/{staff_id}/permissions")
 async def update_staff_permissions(
@@ -211,6 +291,7 @@ async def update_staff_permissions(
         staff.updated_at = datetime.utcnow()
     
     db.commit()
+    cache.invalidate(cache.USERS_SCOPE)
     
     # Логируем действие
     log_activity(
@@ -276,21 +357,105 @@ async def get_subscription_info(
         ]
     }
 
-@router.get("/activity-log")
+@router.get("/activity-log", response_model=List[schemas.ActivityLogOut])
 async def get_activity_log(
     limit: int = 50,
+    page: int = 1,
+    user_id: Optional[int] = None,
+    action: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_admin)
 ):
-    """Получить журнал активности"""
+    """Получить журнал активности (включая архивные записи)"""
     logs = []
     if hasattr(models, 'ActivityLog'):
-        logs = db.query(models.ActivityLog).order_by(
-            models.ActivityLog.created_at.desc()
-        ).limit(limit).all()
+        logs = retention.read_activity_log(
+            db,
+            limit=limit,
+            offset=max(page - 1, 0) * limit,
+            user_id=user_id,
+            action=action
+        )
     
     return logs
 
+@router.get("/activity-log/summary", response_model=List[schemas.ActivityLogDailyOut])
+async def get_activity_log_summary(
+    days: int = 30,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_admin)
+):
+    """Получить дневные сводки журнала активности по действиям и пользователям"""
+    since = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+    return retention.activity_log_summary(db, since)
+
+@router.post("/activity-log/archive", response_model=schemas.JobOut, status_code=status.HTTP_202_ACCEPTED)
+async def archive_activity_log(
+    retention_days: int = retention.ACTIVITY_LOG_RETENTION_DAYS,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_admin)
+):
+    """Запустить архивацию записей журнала старше retention_days (или вернуть уже запущенную)"""
+    return jobs.enqueue_unique(
+        db, "archive_activity_log", {"retention_days": retention_days}, created_by_id=current_user.id
+    )
+
+jobs.schedule(
+    "archive_activity_log",
+    retention.ACTIVITY_ARCHIVE_INTERVAL_SECONDS,
+    {"retention_days": retention.ACTIVITY_LOG_RETENTION_DAYS}
+)
+
+@jobs.handler("archive_activity_log")
+def archive_activity_log_job(context: jobs.JobContext, db: Session, params: dict):
+    # Пульс после каждого сегмента: иначе долгую архивацию сочтут зависшей и запустят повторно
+    context.heartbeat()
+    return retention.archive_activity_logs(
+        db,
+        retention_days=params["retention_days"],
+        on_segment=lambda archived: context.heartbeat()
+    )
+
+@router.get("/jobs", response_model=List[schemas.JobOut])
+async def get_jobs(
+    limit: int = 50,
+    job_status: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_admin)
+):
+    """Получить список фоновых задач"""
+    query = db.query(models.Job)
+    if job_status:
+        query = query.filter(models.Job.status == job_status)
+    return query.order_by(models.Job.id.desc()).limit(limit).all()
+
+def get_job_or_404(job_id: int, db: Session) -> models.Job:
+    job = db.get(models.Job, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Задача не найдена"
+        )
+    return job
+
+@router.get("/jobs/{job_id}", response_model=schemas.JobOut)
+async def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_admin)
+):
+    """Получить статус и прогресс фоновой задачи"""
+    return get_job_or_404(job_id, db)
+
+@router.post("/jobs/{job_id}/cancel", response_model=schemas.JobOut)
+async def cancel_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_admin)
+):
+    """Отменить фоновую задачу"""
+    return jobs.cancel(db, get_job_or_404(job_id, db))
+
 def log_activity(
     db: Session,
     user_id: int,
@@ -349,6 +514,7 @@ async def initialize_admin(
     
     db.add(admin_user)
     db.commit()
+    cache.invalidate(cache.USERS_SCOPE)
     db.refresh(admin_user)
     
     return admin_user
\ No newline at end of file
@@ -1,10 +1,13 @@
-﻿from fastapi import APIRouter, Depends, HTTPException
+﻿from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from .. import database, models, schemas, auth
+from datetime import datetime
+from .. import database, models, schemas, auth, cache, ratelimit
 
 router = APIRouter()
 
+cache.register("/users/me", lambda email: [cache.USERS_SCOPE])
+
 def get_db():
     db = database.SessionLocal()
     try:
@@ -38,14 +41,36 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     )
     db.add(new_user)
     db.commit()
+    cache.invalidate(cache.USERS_SCOPE)
     db.refresh(new_user)
     return new_user
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db)
+):
+    # Лимиты проверяются до запроса к базе и bcrypt, чтобы перебор не нагружал CPU
+    ip = ratelimit.client_ip(request)
+    retry_after = ratelimit.check_login(ip, form_data.username)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много попыток входа, попробуйте позже",
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+
     db_user = db.query(models.User).filter(models.User.email == form_data.username).first()
     if not db_user or not auth.verify_password(form_data.password, db_user.hashed_password):
+        ratelimit.login_failed(ip, form_data.username)
         raise HTTPException(status_code=401, detail="Неверный логин или пароль")
+    ratelimit.login_succeeded(ip, form_data.username)
+
+    # Обновляем время последнего входа (только при входе, чтобы не писать в базу на каждом запросе)
+    db_user.last_login = datetime.utcnow()
+    db.commit()
+    cache.invalidate(cache.USERS_SCOPE)
 
     token = auth.create_access_token({"sub": db_user.email})
     return {"access_token": token, "token_type": "bearer"}
@@ -1,9 +1,16 @@
-﻿from fastapi import APIRouter, Depends, HTTPException
+﻿from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import case, func, or_, select, update
 from sqlalchemy.orm import Session
-from .. import models, schemas, database, auth
+from .. import models, schemas, database, auth, cache, idempotency, analytics
 
 router = APIRouter()
 
+cache.register("/clients", lambda email: [cache.clients_scope(email)])
+
 def get_db():
     db = database.SessionLocal()
     try:
@@ -11,17 +18,137 @@ def get_db():
     finally:
         db.close()
 
+def client_etag(client_id: int, version: Optional[int]) -> str:
+    """ETag версии клиента для If-Match (по счётчику version)"""
+    return f'"{client_id}-{version or 0}"'
+
+def _if_match_versions(if_match: str, client_id: int) -> list:
+    """Номера версий из заголовка If-Match, относящиеся к этому клиенту"""
+    versions = []
+    for tag in if_match.split(","):
+        tag_id, _, version = tag.strip().strip('"').partition("-")
+        if tag_id == str(client_id) and version.isdigit():
+            versions.append(int(version))
+    return versions
+
+def _write_client_changes(
+    db: Session,
+    client_id: int,
+    current_user: models.User,
+    values: dict,
+    if_match: Optional[str]
+) -> dict:
+    """Записать изменённые поля клиента одним UPDATE ... RETURNING
+
+    Строка обновляется, только если хотя бы одно значение действительно
+    отличается; без изменений запись в базу не выполняется. Совпадающие
+    столбцы сохраняют прежнее значение через CASE, а не перезаписываются.
+    """
+    columns = models.Client.__table__.c
+    conditions = [columns.id == client_id, columns.owner_id == current_user.id]
+    if if_match and if_match.strip() != "*":
+        conditions.append(columns.version.in_(_if_match_versions(if_match, client_id)))
+
+    row = None
+    previous = None
+    now = datetime.utcnow()
+    if values:
+        changed = or_(*[columns[field].is_distinct_from(value) for field, value in values.items()])
+        status_conditions = []
+        if "status" in values:
+            # Прежний статус нужен для истории; условие на него защищает от гонки
+            previous = db.execute(
+                select(columns.status, columns.created_at)
+                .where(columns.id == client_id, columns.owner_id == current_user.id)
+            ).first()
+            if previous is not None:
+                status_conditions.append(columns.status.is_not_distinct_from(previous.status))
+        row = db.execute(
+            update(models.Client.__table__)
+            .where(*conditions, *status_conditions, changed)
+            .values(
+                **{
+                    field: case((columns[field].is_distinct_from(value), value), else_=columns[field])
+                    for field, value in values.items()
+                },
+                updated_at=now,
+                version=columns.version + 1
+            )
+            .returning(*columns)
+        ).first()
+
+    if row is not None:
+        if previous is not None and row.status != previous.status:
+            analytics.record_status_change(
+                db, client_id, current_user.id, previous.status, row.status,
+                client_created_at=previous.created_at, changed_by_id=current_user.id, changed_at=now
+            )
+        db.commit()
+        cache.invalidate(cache.clients_scope(current_user.email))
+        return dict(row._mapping)
+
+    # Ничего не обновлено: клиента нет, If-Match устарел или данные не изменились
+    db.rollback()
+    current = db.execute(
+        select(*columns).where(columns.id == client_id, columns.owner_id == current_user.id)
+    ).first()
+    if current is None:
+        raise HTTPException(status_code=404, detail="Клиент не найден")
+    if previous is not None and current.status != previous.status:
+        raise HTTPException(status_code=409, detail="Статус клиента изменён параллельным запросом")
+    if if_match and if_match.strip() != "*" and client_etag(client_id, current.version) not in [
+        tag.strip() for tag in if_match.split(",")
+    ]:
+        raise HTTPException(status_code=412, detail="Клиент был изменён другим запросом")
+    # 200 без записи допустим, только если клиент уже содержит запрошенные значения
+    if any(current._mapping[field] != value for field, value in values.items()):
+        raise HTTPException(status_code=409, detail="Клиент был изменён параллельным запросом")
+    return dict(current._mapping)
+
 @router.post("/clients", response_model=schemas.ClientOut)
 def create_client(
     client: schemas.ClientCreate, 
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    """Создать нового клиента"""
-    db_client = models.Client(**client.dict(), owner_id=current_user.id)
-    db.add(db_client)
-    db.commit()
+    """Создать нового клиента (повтор с тем же Idempotency-Key вернёт первый ответ)"""
+    scope = f"clients:{current_user.id}"
+    if idempotency_key:
+        replayed = idempotency.store.begin(
+            db, scope, idempotency_key, idempotency.fingerprint(client.dict())
+        )
+        if replayed is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            response.headers["ETag"] = client_etag(replayed["id"], replayed.get("version"))
+            return replayed
+
+    try:
+        now = datetime.utcnow()
+        db_client = models.Client(
+            **client.dict(), owner_id=current_user.id, created_at=now, updated_at=now
+        )
+        db.add(db_client)
+        db.flush()
+        analytics.record_status_change(
+            db, db_client.id, current_user.id, None, db_client.status,
+            client_created_at=now, changed_by_id=current_user.id, changed_at=now, is_creation=True
+        )
+        if idempotency_key:
+            idempotency.store.complete(
+                db, scope, idempotency_key,
+                jsonable_encoder(schemas.ClientOut.model_validate(db_client))
+            )
+        db.commit()
+    except Exception:
+        if idempotency_key:
+            idempotency.store.release(db, scope, idempotency_key)
+        raise
+    cache.invalidate(cache.clients_scope(current_user.email), cache.CLIENTS_SCOPE)
     db.refresh(db_client)
+
+    response.headers["ETag"] = client_etag(db_client.id, db_client.version)
     return db_client
 
 @router.get("/clients", response_model=list[schemas.ClientOut])
@@ -49,27 +176,90 @@ def delete_client(
     
     db.delete(client)
     db.commit()
+    cache.invalidate(cache.clients_scope(current_user.email), cache.CLIENTS_SCOPE)
     return {"message": "Клиент удалён"}
 
 @router.put("/clients/{client_id}", response_model=schemas.ClientOut)
 def update_client(
     client_id: int, 
     updated_data: schemas.ClientCreate, 
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    """Обновить данные клиента"""
-    client = db.query(models.Client).filter(
-        models.Client.id == client_id,
-        models.Client.owner_id == current_user.id
-    ).first()
+    """Обновить данные клиента (с If-Match - только если клиент не изменился)"""
+    client = _write_client_changes(db, client_id, current_user, updated_data.dict(), if_match)
+    response.headers["ETag"] = client_etag(client["id"], client["version"])
+    return client
 
-    if not client:
-        raise HTTPException(status_code=404, detail="Клиент не найден")
+@router.patch("/clients/{client_id}", response_model=schemas.ClientOut)
+def patch_client(
+    client_id: int, 
+    updated_data: schemas.ClientUpdate, 
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db), 
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Частично обновить клиента: записываются только переданные и изменившиеся поля"""
+    client = _write_client_changes(
+        db, client_id, current_user, updated_data.dict(exclude_unset=True), if_match
+    )
+    response.headers["ETag"] = client_etag(client["id"], client["version"])
+    return client
+
+@router.get("/clients/analytics/funnel", response_model=List[schemas.FunnelStageOut])
+def get_funnel(
+    days: int = 30,
+    db: Session = Depends(get_db), 
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Воронка по статусам за период: входы, выходы и среднее время в статусе"""
+    since = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+    funnel = models.ClientFunnelDaily
+    rows = db.query(
+        funnel.status,
+        func.sum(funnel.entered),
+        func.sum(funnel.exited),
+        func.sum(funnel.time_in_stage_seconds)
+    ).filter(
+        funnel.owner_id == current_user.id,
+        funnel.day >= since
+    ).group_by(funnel.status).all()
 
-    for field, value in updated_data.dict().items():
-        setattr(client, field, value)
+    return [
+        {
+            "status": status,
+            "entered": entered,
+            "exited": exited,
+            "avg_time_in_stage_seconds": round(seconds / exited, 1) if exited else None
+        }
+        for status, entered, exited, seconds in rows
+    ]
 
-    db.commit()
-    db.refresh(client)
-    return client
\ No newline at end of file
+@router.get("/clients/analytics/cohorts", response_model=List[schemas.CohortStageOut])
+def get_cohorts(
+    days: int = 90,
+    db: Session = Depends(get_db), 
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Когорты клиентов по дню создания: сколько дошло до каждого статуса"""
+    since = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%d")
+    cohorts = db.query(models.ClientCohortDaily).filter(
+        models.ClientCohortDaily.owner_id == current_user.id,
+        models.ClientCohortDaily.cohort_day >= since
+    ).order_by(models.ClientCohortDaily.cohort_day).all()
+
+    sizes = defaultdict(int)
+    for cohort in cohorts:
+        sizes[cohort.cohort_day] += cohort.created
+    return [
+        {
+            "cohort_day": cohort.cohort_day,
+            "cohort_size": sizes[cohort.cohort_day],
+            "status": cohort.status,
+            "reached": cohort.reached
+        }
+        for cohort in cohorts
+    ]
\ No newline at end of file
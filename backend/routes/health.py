@@ -0,0 +1,55 @@
+﻿from fastapi import APIRouter, Response, status
+from fastapi.responses import PlainTextResponse
+import time
+from sqlalchemy import text
+from .. import database, migrations, ratelimit
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+# Сколько соединений пула открыть заранее при старте воркера
+WARM_CONNECTIONS = 2
+
+_state = {
+    "ready": False,
+    "reason": "starting",
+    "startup_seconds": None,
+}
+
+def warm_up(started_at: float) -> bool:
+    """Проверить схему и прогреть пул соединений; возвращает готовность воркера"""
+    pending = [name for _, name in migrations.pending(database.engine)]
+    if pending:
+        _state.update(ready=False, reason=f"pending migrations: {', '.join(pending)}")
+        return False
+
+    connections = [database.engine.connect() for _ in range(WARM_CONNECTIONS)]
+    try:
+        for connection in connections:
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+    _state.update(ready=True, reason=None, startup_seconds=round(time.perf_counter() - started_at, 4))
+    return True
+
+def mark_stopping():
+    _state.update(ready=False, reason="stopping")
+
+@router.get("/live")
+def liveness():
+    """Процесс запущен и отвечает"""
+    return {"status": "ok"}
+
+@router.get("/ready")
+def readiness(response: Response):
+    """Воркер готов принимать трафик: схема актуальна, пул прогрет"""
+    if not _state["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "starting", "reason": _state["reason"]}
+    return {"status": "ready", "startup_seconds": _state["startup_seconds"]}
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Счётчики попыток входа и ограничителя частоты для Prometheus"""
+    return PlainTextResponse(ratelimit.render_metrics(), media_type="text/plain; version=0.0.4")
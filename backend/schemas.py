@@ -1,4 +1,4 @@
-﻿from pydantic import BaseModel, EmailStr
+﻿from pydantic import BaseModel, EmailStr, field_validator
 from typing import Optional, Dict, Any
 from datetime import datetime
 
@@ -45,11 +45,33 @@ class ClientBase(BaseModel):
     status: Optional[str] = "новый"
 
 class ClientCreate(ClientBase):
-    pass
+    @field_validator("status", mode="before")
+    @classmethod
+    def reject_null_status(cls, value):
+        # Статус можно не передавать (будет "новый"), но не null: его не учесть в воронке
+        if value is None:
+            raise ValueError("значение не может быть null")
+        return value
+
+class ClientUpdate(BaseModel):
+    name: Optional[str] = None
+    phone: Optional[str] = None
+    note: Optional[str] = None
+    status: Optional[str] = None
+
+    @field_validator("name", "phone", "note", "status", mode="before")
+    @classmethod
+    def reject_null(cls, value):
+        # Поле можно не передавать, но нельзя обнулить явным null
+        if value is None:
+            raise ValueError("значение не может быть null")
+        return value
 
 class ClientOut(ClientBase):
     id: int
     created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    version: Optional[int] = None
     owner_id: Optional[int] = None
 
     class Config:
@@ -89,4 +111,62 @@ class NotificationOut(BaseModel):
     read: bool = False
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Схемы для журнала активности
+class ActivityLogOut(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    action: Optional[str] = None
+    target_type: Optional[str] = None
+    target_id: Optional[int] = None
+    description: Optional[str] = None
+    ip_address: Optional[str] = None
+    user_agent: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ActivityLogDailyOut(BaseModel):
+    day: str
+    user_id: Optional[int] = None
+    action: Optional[str] = None
+    count: int
+
+    class Config:
+        from_attributes = True
+
+# Схемы для фоновых задач
+class JobOut(BaseModel):
+    id: int
+    type: str
+    status: str
+    params: Optional[Dict[str, Any]] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    progress: int = 0
+    progress_message: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int = 3
+    cancel_requested: bool = False
+    created_by_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Схемы для аналитики воронки
+class FunnelStageOut(BaseModel):
+    status: str
+    entered: int
+    exited: int
+    avg_time_in_stage_seconds: Optional[float] = None
+
+class CohortStageOut(BaseModel):
+    cohort_day: str
+    cohort_size: int
+    status: str
+    reached: int
\ No newline at end of file
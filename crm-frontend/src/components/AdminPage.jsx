@@ -1,6 +1,9 @@
-﻿import { useState, useEffect } from 'react';
+﻿import { useState, useEffect, useRef } from 'react';
 import { Users, Shield, CreditCard, Settings, UserPlus, Crown, Trash2, Edit, Mail, Lock, Calendar, AlertCircle, CheckCircle, XCircle } from 'lucide-react';
 
+// Сколько раз (раз в секунду) проверять фоновую задачу, прежде чем перестать ждать
+const JOB_POLL_LIMIT = 30;
+
 const AdminPage = ({ token, onError, onSuccess }) => {
   const [activeTab, setActiveTab] = useState('staff');
   const [staff, setStaff] = useState([]);
@@ -55,6 +58,15 @@ const AdminPage = ({ token, onError, onSuccess }) => {
     fetchStaff();
   }, []);
 
+  // Прекращаем опрос фоновых задач, когда страница закрыта
+  const isMounted = useRef(true);
+  useEffect(() => {
+    isMounted.current = true;
+    return () => {
+      isMounted.current = false;
+    };
+  }, []);
+
   // Добавление сотрудника
   const handleAddStaff = async (e) => {
     e.preventDefault();
@@ -93,7 +105,21 @@ const AdminPage = ({ token, onError, onSuccess }) => {
     }
   };
 
-  // Удаление сотрудника
+  // Ожидание завершения фоновой задачи; null - задача ещё выполняется или страница закрыта
+  const waitForJob = async (jobId) => {
+    for (let attempt = 0; attempt < JOB_POLL_LIMIT && isMounted.current; attempt++) {
+      const response = await fetch(`http://127.0.0.1:8000/admin/jobs/${jobId}`, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (!response.ok) return { status: 'failed' };
+      const job = await response.json();
+      if (['succeeded', 'failed', 'cancelled'].includes(job.status)) return job;
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+    return null;
+  };
+
+  // Удаление сотрудника (клиенты переназначаются фоновой задачей)
   const handleDeleteStaff = async (staffId) => {
     if (!confirm('Вы уверены, что хотите удалить этого сотрудника?')) return;
 
@@ -104,7 +130,16 @@ const AdminPage = ({ token, onError, onSuccess }) => {
       });
 
       if (response.ok) {
-        onSuccess('Сотрудник удален');
+        const { job_id } = await response.json();
+        const job = await waitForJob(job_id);
+        if (!isMounted.current) return;
+        if (!job) {
+          onSuccess('Удаление сотрудника ещё выполняется, список обновится позже');
+        } else if (job.status === 'succeeded') {
+          onSuccess('Сотрудник удален');
+        } else {
+          onError('Ошибка при удалении сотрудника');
+        }
         fetchStaff();
       } else {
         onError('Ошибка при удалении сотрудника');
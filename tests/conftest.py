@@ -0,0 +1,36 @@
+﻿import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from backend import cache, database, migrations, ratelimit, retention
+from backend.main import app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Приложение на чистой базе во временном каталоге (без lifespan: без задач и шины)"""
+    monkeypatch.chdir(tmp_path)
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'users.db'}", connect_args={"check_same_thread": False, "timeout": 1}
+    )
+    migrations.upgrade(engine)
+    original_engine = database.engine
+    monkeypatch.setattr(database, "engine", engine)
+    database.SessionLocal.configure(bind=engine)
+    monkeypatch.setattr(retention, "ACTIVITY_ARCHIVE_DIR", str(tmp_path / "archive"))
+    cache.response_cache.clear()
+    monkeypatch.setattr(ratelimit, "store", ratelimit.MemoryBucketStore())
+    try:
+        yield TestClient(app)
+    finally:
+        database.SessionLocal.configure(bind=original_engine)
+        engine.dispose()
+
+
+@pytest.fixture
+def auth_headers(client):
+    client.post("/register", json={"email": "owner@example.com", "name": "Owner", "password": "pw"})
+    token = client.post(
+        "/login", data={"username": "owner@example.com", "password": "pw"}
+    ).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from backend import database, jobs, models, retention
+
+
+def test_summary_includes_recent_and_archived_days(client, auth_headers):
+    old_day = datetime.utcnow() - timedelta(days=100)
+    db = database.SessionLocal()
+    try:
+        db.add(models.ActivityLog(action="login", target_type="user", target_id=1, created_at=old_day))
+        db.commit()
+    finally:
+        db.close()
+
+    created = client.post(
+        "/admin/staff",
+        json={"email": "staff@example.com", "name": "Staff", "password": "pw"},
+        headers=auth_headers,
+    )
+    assert created.status_code == 200
+
+    db = database.SessionLocal()
+    try:
+        assert retention.archive_activity_logs(db)["archived"] == 1
+    finally:
+        db.close()
+
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    recent = client.get("/admin/activity-log/summary", headers=auth_headers).json()
+    assert [(row["day"], row["action"]) for row in recent] == [(today, "create")]
+
+    summary = client.get("/admin/activity-log/summary?days=120", headers=auth_headers).json()
+    assert [(row["day"], row["action"], row["count"]) for row in summary] == [
+        (today, "create", 1), (old_day.strftime("%Y-%m-%d"), "login", 1)
+    ]
+
+
+def _archive_jobs():
+    db = database.SessionLocal()
+    try:
+        return db.query(models.Job).filter(models.Job.type == "archive_activity_log").all()
+    finally:
+        db.close()
+
+
+def test_archive_is_scheduled_once_per_interval(client, auth_headers):
+    jobs.runner._enqueue_scheduled()
+    jobs.runner._enqueue_scheduled()
+    scheduled = _archive_jobs()
+    assert len(scheduled) == 1
+
+    jobs.runner._run(scheduled[0].id)
+    jobs.runner._enqueue_scheduled()
+
+    assert [job.status for job in _archive_jobs()] == ["succeeded"]
+
+
+def test_manual_archive_reuses_active_job(client, auth_headers):
+    first = client.post("/admin/activity-log/archive", headers=auth_headers).json()
+    second = client.post("/admin/activity-log/archive", headers=auth_headers).json()
+
+    assert first["id"] == second["id"]
+    assert len(_archive_jobs()) == 1
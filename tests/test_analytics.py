@@ -0,0 +1,129 @@
+﻿from backend import database, jobs, models
+from backend.routes import admin_routes
+
+
+def _login(client, email):
+    token = client.post("/login", data={"username": email, "password": "pw"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_deleting_staff_moves_cohorts_to_new_owner(client, auth_headers):
+    staff = client.post(
+        "/admin/staff",
+        json={"email": "staff@example.com", "name": "Staff", "password": "pw"},
+        headers=auth_headers,
+    ).json()
+    staff_headers = _login(client, "staff@example.com")
+    client_id = client.post(
+        "/clients", json={"name": "Иван", "phone": "+70000000000"}, headers=staff_headers
+    ).json()["id"]
+
+    job_id = client.delete(f"/admin/staff/{staff['id']}", headers=auth_headers).json()["job_id"]
+    jobs.runner._run(job_id)
+    db = database.SessionLocal()
+    try:
+        assert db.get(models.Job, job_id).status == "succeeded"
+    finally:
+        db.close()
+
+    patched = client.patch(
+        f"/clients/{client_id}", json={"status": "в работе"}, headers=auth_headers
+    )
+    assert patched.status_code == 200
+
+    cohorts = client.get("/clients/analytics/cohorts", headers=auth_headers).json()
+    assert {(row["status"], row["cohort_size"], row["reached"]) for row in cohorts} == {
+        ("новый", 1, 1), ("в работе", 1, 1)
+    }
+    funnel = client.get("/clients/analytics/funnel", headers=auth_headers).json()
+    funnel = {row["status"]: row for row in funnel}
+    assert funnel["новый"]["entered"] == 1
+    assert funnel["новый"]["exited"] == 1
+
+
+def test_null_status_is_rejected_and_keeps_funnel_consistent(client, auth_headers):
+    assert client.post(
+        "/clients", json={"name": "Иван", "phone": "+70000000000", "status": None}, headers=auth_headers
+    ).status_code == 422
+    client_id = client.post(
+        "/clients", json={"name": "Иван", "phone": "+70000000000"}, headers=auth_headers
+    ).json()["id"]
+    client.patch(f"/clients/{client_id}", json={"status": "в работе"}, headers=auth_headers)
+
+    put = client.put(
+        f"/clients/{client_id}",
+        json={"name": "Иван", "phone": "+70000000000", "status": None},
+        headers=auth_headers,
+    )
+    assert put.status_code == 422
+
+    client.patch(f"/clients/{client_id}", json={"status": "новый"}, headers=auth_headers)
+
+    cohorts = client.get("/clients/analytics/cohorts", headers=auth_headers).json()
+    assert {(row["status"], row["cohort_size"], row["reached"]) for row in cohorts} == {
+        ("новый", 1, 1), ("в работе", 1, 1)
+    }
+    funnel = {row["status"]: row for row in client.get("/clients/analytics/funnel", headers=auth_headers).json()}
+    assert (funnel["новый"]["entered"], funnel["новый"]["exited"]) == (2, 1)
+    assert (funnel["в работе"]["entered"], funnel["в работе"]["exited"]) == (1, 1)
+
+
+def test_client_without_status_is_not_counted_as_created_again(client, auth_headers):
+    client_id = client.post(
+        "/clients", json={"name": "Иван", "phone": "+70000000000"}, headers=auth_headers
+    ).json()["id"]
+    # Старая запись без статуса
+    db = database.SessionLocal()
+    db.query(models.Client).filter(models.Client.id == client_id).update({"status": None})
+    db.commit()
+    db.close()
+
+    assert client.patch(
+        f"/clients/{client_id}", json={"status": "в работе"}, headers=auth_headers
+    ).status_code == 200
+
+    cohorts = client.get("/clients/analytics/cohorts", headers=auth_headers).json()
+    assert {(row["status"], row["cohort_size"], row["reached"]) for row in cohorts} == {
+        ("новый", 1, 1), ("в работе", 1, 1)
+    }
+
+
+def test_cancel_during_staff_reassignment_finishes_the_move(client, auth_headers, monkeypatch):
+    staff = client.post(
+        "/admin/staff",
+        json={"email": "staff@example.com", "name": "Staff", "password": "pw"},
+        headers=auth_headers,
+    ).json()
+    staff_headers = _login(client, "staff@example.com")
+    for name in ["Иван", "Пётр"]:
+        client.post("/clients", json={"name": name, "phone": "+70000000000"}, headers=staff_headers)
+    job_id = client.delete(f"/admin/staff/{staff['id']}", headers=auth_headers).json()["job_id"]
+
+    # Отмена приходит после первой пачки
+    monkeypatch.setattr(admin_routes, "REASSIGN_BATCH_SIZE", 1)
+    progress = jobs.JobContext.progress
+
+    def cancel_then_progress(context, *args, **kwargs):
+        db = database.SessionLocal()
+        db.query(models.Job).filter(models.Job.id == job_id).update({"cancel_requested": True})
+        db.commit()
+        db.close()
+        return progress(context, *args, **kwargs)
+
+    monkeypatch.setattr(jobs.JobContext, "progress", cancel_then_progress)
+    jobs.runner._run(job_id)
+
+    db = database.SessionLocal()
+    try:
+        assert db.get(models.Job, job_id).status == "succeeded"
+        assert db.get(models.User, staff["id"]) is None
+        assert db.query(models.ClientCohortDaily).filter(
+            models.ClientCohortDaily.owner_id == staff["id"]
+        ).count() == 0
+        assert db.query(models.ClientStatusHistory).filter(
+            models.ClientStatusHistory.owner_id == staff["id"]
+        ).count() == 0
+    finally:
+        db.close()
+    cohorts = client.get("/clients/analytics/cohorts", headers=auth_headers).json()
+    assert [(row["status"], row["cohort_size"]) for row in cohorts] == [("новый", 2)]
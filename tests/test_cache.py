@@ -0,0 +1,194 @@
+﻿import threading
+
+from backend import bus, cache, database, models
+
+
+def _new_client(client, headers, name="Иван"):
+    response = client.post("/clients", json={"name": name, "phone": "+70000000000"}, headers=headers)
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_matching_if_none_match_returns_304(client, auth_headers):
+    first = client.get("/clients", headers=auth_headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    second = client.get("/clients", headers={**auth_headers, "If-None-Match": etag})
+
+    assert second.status_code == 304
+    assert second.headers["ETag"] == etag
+    assert second.content == b""
+
+
+def test_client_changes_change_etag(client, auth_headers):
+    etag = client.get("/clients", headers=auth_headers).headers["ETag"]
+
+    client_id = _new_client(client, auth_headers)
+    after_create = client.get("/clients", headers={**auth_headers, "If-None-Match": etag})
+    assert after_create.status_code == 200
+    assert [item["id"] for item in after_create.json()] == [client_id]
+
+    client.delete(f"/clients/{client_id}", headers=auth_headers)
+    after_delete = client.get(
+        "/clients", headers={**auth_headers, "If-None-Match": after_create.headers["ETag"]}
+    )
+    assert after_delete.status_code == 200
+    assert after_delete.json() == []
+
+
+def test_staff_changes_change_etag(client, auth_headers):
+    before = client.get("/admin/staff", headers=auth_headers)
+    assert before.status_code == 200
+
+    created = client.post(
+        "/admin/staff",
+        json={"email": "staff@example.com", "name": "Staff", "password": "pw"},
+        headers=auth_headers,
+    )
+    assert created.status_code == 200
+
+    after = client.get("/admin/staff", headers={**auth_headers, "If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert "staff@example.com" in {user["email"] for user in after.json()}
+
+
+def test_cached_body_is_served_until_invalidated(client, auth_headers):
+    _new_client(client, auth_headers)
+    first = client.get("/clients", headers=auth_headers).json()
+    assert client.get("/clients", headers=auth_headers).json() == first
+
+    _new_client(client, auth_headers, name="Пётр")
+    assert len(client.get("/clients", headers=auth_headers).json()) == 2
+
+
+def test_response_cache_evicts_least_recently_used():
+    response_cache = cache.ResponseCache(max_entries=2, max_bytes=1000, max_entry_bytes=100)
+    response_cache.put("a", "1", b"a")
+    response_cache.put("b", "1", b"b")
+    assert response_cache.get("a", "1") == b"a"
+
+    response_cache.put("c", "1", b"c")
+
+    assert response_cache.get("b", "1") is None
+    assert response_cache.get("a", "1") == b"a"
+    assert response_cache.get("c", "1") == b"c"
+
+
+def test_response_cache_respects_size_limits():
+    response_cache = cache.ResponseCache(max_entries=10, max_bytes=10, max_entry_bytes=6)
+    response_cache.put("big", "1", b"x" * 7)
+    assert response_cache.get("big", "1") is None
+
+    response_cache.put("a", "1", b"x" * 6)
+    response_cache.put("b", "1", b"y" * 6)
+
+    assert response_cache.get("a", "1") is None
+    assert response_cache.get("b", "1") == b"y" * 6
+
+
+def test_response_cache_drops_entry_with_stale_etag():
+    response_cache = cache.ResponseCache(max_entries=10, max_bytes=100, max_entry_bytes=100)
+    response_cache.put("a", "1", b"a")
+
+    assert response_cache.get("a", "2") is None
+    assert response_cache.get("a", "1") is None
+
+
+def test_cached_admin_body_requires_current_admin_role(client, auth_headers):
+    first = client.get("/admin/staff", headers=auth_headers)
+    assert first.status_code == 200
+
+    db = database.SessionLocal()
+    db.query(models.User).filter(models.User.email == "owner@example.com").update({"role": "staff"})
+    db.commit()
+    db.close()
+
+    assert client.get("/admin/staff", headers=auth_headers).status_code == 403
+    revalidated = client.get("/admin/staff", headers={**auth_headers, "If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 403
+
+
+def test_etag_expires_after_max_age(client, auth_headers, monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    etag = client.get("/clients", headers=auth_headers).headers["ETag"]
+
+    now[0] += cache.RESPONSE_CACHE_MAX_AGE_SECONDS
+    response = client.get("/clients", headers={**auth_headers, "If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_new_epoch_drops_previous_etags():
+    versions = cache.VersionRegistry()
+    etag = versions.etag("key", ["users"])
+
+    versions.new_epoch()
+
+    assert versions.etag("key", ["users"]) != etag
+
+
+def test_unix_socket_bus_creates_origin_on_start(tmp_path):
+    worker = bus.UnixSocketBus(str(tmp_path), name="worker")
+    assert worker.origin is None
+
+    worker.start(lambda scopes: None)
+    first = worker.origin
+    worker.stop()
+    worker.start(lambda scopes: None)
+    try:
+        assert first and worker.origin and worker.origin != first
+    finally:
+        worker.stop()
+
+
+class _FlakyPubSub:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def subscribe(self, channel):
+        pass
+
+    def listen(self):
+        for message in self.messages:
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+    def close(self):
+        pass
+
+
+class _FlakyRedis:
+    def __init__(self):
+        self.subscriptions = 0
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        self.subscriptions += 1
+        if self.subscriptions == 1:
+            return _FlakyPubSub([ConnectionError("connection lost")])
+        message = bus._encode("other-worker", ["users"])
+        return _FlakyPubSub([{"type": "message", "data": message}])
+
+
+def test_redis_bus_resubscribes_after_failure(monkeypatch):
+    monkeypatch.setattr(bus, "CACHE_BUS_RECONNECT_SECONDS", 0)
+    received = []
+    delivered = threading.Event()
+
+    def on_message(scopes):
+        received.append(scopes)
+        if scopes is not None:
+            delivered.set()
+
+    redis_bus = bus.RedisBus(_FlakyRedis())
+    redis_bus.start(on_message)
+    try:
+        assert delivered.wait(5)
+    finally:
+        redis_bus.stop()
+
+    # Сначала сброс всего (сообщения за время разрыва потеряны), затем инвалидация
+    assert received[:2] == [None, ["users"]]
@@ -0,0 +1,129 @@
+﻿from sqlalchemy import event, text
+
+from backend import database
+
+
+def _create_client(client, headers, **fields):
+    payload = {"name": "Иван", "phone": "+70000000000", **fields}
+    response = client.post("/clients", json=payload, headers=headers)
+    assert response.status_code == 200
+    return response
+
+
+def _stored_without_microseconds(client_id):
+    """Строка как у клиентов, записанных через func.now(): updated_at без дробной части"""
+    with database.engine.begin() as connection:
+        connection.execute(
+            text("UPDATE clients SET updated_at = '2025-01-01 10:00:00' WHERE id = :id"),
+            {"id": client_id},
+        )
+
+
+def _stored_name(client_id):
+    with database.engine.connect() as connection:
+        return connection.execute(
+            text("SELECT name FROM clients WHERE id = :id"), {"id": client_id}
+        ).scalar()
+
+
+def test_patch_with_if_match_writes_row_stored_without_microseconds(client, auth_headers):
+    created = _create_client(client, auth_headers)
+    client_id = created.json()["id"]
+    _stored_without_microseconds(client_id)
+
+    response = client.patch(
+        f"/clients/{client_id}",
+        json={"name": "CHANGED"},
+        headers={**auth_headers, "If-Match": created.headers["ETag"]},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["name"] == "CHANGED"
+    assert _stored_name(client_id) == "CHANGED"
+    assert response.headers["ETag"] != created.headers["ETag"]
+
+
+def test_put_with_if_match_writes_row_stored_without_microseconds(client, auth_headers):
+    created = _create_client(client, auth_headers)
+    client_id = created.json()["id"]
+    _stored_without_microseconds(client_id)
+
+    response = client.put(
+        f"/clients/{client_id}",
+        json={"name": "CHANGED", "phone": "+70000000000"},
+        headers={**auth_headers, "If-Match": created.headers["ETag"]},
+    )
+
+    assert response.status_code == 200
+    assert _stored_name(client_id) == "CHANGED"
+
+
+def test_stale_if_match_is_rejected(client, auth_headers):
+    created = _create_client(client, auth_headers)
+    client_id = created.json()["id"]
+    first = client.patch(
+        f"/clients/{client_id}",
+        json={"name": "Первый"},
+        headers={**auth_headers, "If-Match": created.headers["ETag"]},
+    )
+    assert first.status_code == 200
+
+    second = client.patch(
+        f"/clients/{client_id}",
+        json={"name": "Второй"},
+        headers={**auth_headers, "If-Match": created.headers["ETag"]},
+    )
+
+    assert second.status_code == 412
+    assert _stored_name(client_id) == "Первый"
+
+
+def test_patch_without_changes_keeps_version(client, auth_headers):
+    created = _create_client(client, auth_headers)
+    client_id = created.json()["id"]
+
+    response = client.patch(
+        f"/clients/{client_id}",
+        json={"name": "Иван"},
+        headers={**auth_headers, "If-Match": created.headers["ETag"]},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == created.headers["ETag"]
+
+
+def test_patch_rejects_null_for_required_fields(client, auth_headers):
+    client_id = _create_client(client, auth_headers).json()["id"]
+
+    for field in ["name", "phone", "status"]:
+        response = client.patch(f"/clients/{client_id}", json={field: None}, headers=auth_headers)
+        assert response.status_code == 422
+
+    assert _stored_name(client_id) == "Иван"
+    listing = client.get("/clients", headers=auth_headers)
+    assert listing.status_code == 200
+    assert [item["name"] for item in listing.json()] == ["Иван"]
+
+
+def test_update_statement_keeps_unchanged_columns(client, auth_headers):
+    client_id = _create_client(client, auth_headers).json()["id"]
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE clients"):
+            statements.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", capture)
+    try:
+        response = client.patch(
+            f"/clients/{client_id}",
+            json={"name": "Иван", "phone": "+71111111111"},
+            headers=auth_headers,
+        )
+    finally:
+        event.remove(database.engine, "before_cursor_execute", capture)
+
+    assert response.status_code == 200
+    assert response.json()["phone"] == "+71111111111"
+    assert len(statements) == 1
+    assert "name=CASE WHEN" in statements[0].replace(" = ", "=")
@@ -0,0 +1,79 @@
+﻿from unittest import mock
+
+from sqlalchemy.orm import Session
+
+from backend import database, idempotency
+
+PAYLOAD = {"name": "Иван", "phone": "+70000000000"}
+
+
+def _post(client, headers, key, payload=PAYLOAD):
+    return client.post("/clients", json=payload, headers={**headers, "Idempotency-Key": key})
+
+
+def _client_count(client, headers):
+    return len(client.get("/clients", headers=headers).json())
+
+
+def test_repeated_request_replays_first_response(client, auth_headers):
+    first = _post(client, auth_headers, "key-1")
+    second = _post(client, auth_headers, "key-1")
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert _client_count(client, auth_headers) == 1
+
+
+def test_same_key_with_different_body_is_rejected(client, auth_headers):
+    assert _post(client, auth_headers, "key-1").status_code == 200
+
+    response = _post(client, auth_headers, "key-1", {**PAYLOAD, "name": "Пётр"})
+
+    assert response.status_code == 422
+    assert _client_count(client, auth_headers) == 1
+
+
+def test_concurrent_duplicate_gets_409_until_first_finishes(client, auth_headers):
+    owner_id = client.get("/users/me", headers=auth_headers).json()["id"]
+    request_fingerprint = idempotency.fingerprint({**PAYLOAD, "note": "", "status": "новый"})
+    first = database.SessionLocal()
+    try:
+        assert idempotency.store.begin(
+            first, f"clients:{owner_id}", "key-1", request_fingerprint
+        ) is None
+
+        assert _post(client, auth_headers, "key-1").status_code == 409
+    finally:
+        # Первый запрос упал: резерв откатывается вместе с его транзакцией
+        first.rollback()
+        first.close()
+
+    assert _post(client, auth_headers, "key-1").status_code == 200
+    assert _client_count(client, auth_headers) == 1
+
+
+def test_failure_after_commit_still_replays(client, auth_headers):
+    with mock.patch.object(Session, "refresh", side_effect=RuntimeError("refresh failed")):
+        try:
+            _post(client, auth_headers, "key-1")
+        except RuntimeError:
+            pass
+
+    response = _post(client, auth_headers, "key-1")
+
+    assert response.status_code == 200
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert _client_count(client, auth_headers) == 1
+
+
+def test_staff_creation_is_replayed(client, auth_headers):
+    payload = {"email": "staff@example.com", "name": "Staff", "password": "pw"}
+    headers = {**auth_headers, "Idempotency-Key": "staff-1"}
+
+    first = client.post("/admin/staff", json=payload, headers=headers)
+    second = client.post("/admin/staff", json=payload, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
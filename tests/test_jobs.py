@@ -0,0 +1,23 @@
+from backend import database, jobs, models
+
+
+def test_missing_admin_fails_delete_staff_without_retry(client, auth_headers):
+    staff = client.post(
+        "/admin/staff",
+        json={"email": "staff@example.com", "name": "Staff", "password": "pw"},
+        headers=auth_headers,
+    ).json()
+    db = database.SessionLocal()
+    try:
+        job = jobs.enqueue(db, "delete_staff", {"staff_id": staff["id"], "admin_id": 999})
+        jobs.runner._claim()
+        jobs.runner._run(job.id)
+        db.expire_all()
+        job = db.get(models.Job, job.id)
+
+        assert job.status == "failed"
+        assert job.attempts == 1
+        assert "999" in job.error
+        assert db.get(models.User, staff["id"]) is not None
+    finally:
+        db.close()
@@ -0,0 +1,54 @@
+from unittest import mock
+
+from backend import auth, ratelimit
+
+
+def _login(client, password, ip):
+    return client.post(
+        "/login",
+        data={"username": "owner@example.com", "password": password},
+        headers={"X-Forwarded-For": ip},
+    )
+
+
+def test_failed_attempts_from_other_ip_do_not_lock_out_owner(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(ratelimit, "TRUST_FORWARDED_FOR", True)
+    for _ in range(ratelimit.LOGIN_ACCOUNT_LIMIT[0] + 3):
+        _login(client, "wrong", "203.0.113.7")
+
+    assert _login(client, "pw", "198.51.100.1").status_code == 200
+
+
+def test_rejected_attempt_skips_password_check(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(ratelimit, "TRUST_FORWARDED_FOR", True)
+    for _ in range(ratelimit.LOGIN_ACCOUNT_LIMIT[0]):
+        assert _login(client, "wrong", "203.0.113.7").status_code == 401
+
+    with mock.patch.object(auth, "verify_password") as verify_password:
+        response = _login(client, "pw", "203.0.113.7")
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    verify_password.assert_not_called()
+
+
+def test_successful_logins_do_not_use_up_account_limit(client, auth_headers):
+    for _ in range(ratelimit.LOGIN_ACCOUNT_LIMIT[0] + 3):
+        response = client.post("/login", data={"username": "owner@example.com", "password": "pw"})
+        assert response.status_code == 200
+
+
+def test_distributed_attempts_hit_global_account_limit(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(ratelimit, "TRUST_FORWARDED_FOR", True)
+    monkeypatch.setattr(ratelimit, "LOGIN_ACCOUNT_GLOBAL_LIMIT", (6, 6 / 900))
+    rejected = ratelimit.metrics["rejected_account_global"]
+    # Каждый адрес укладывается в строгий лимит, вместе - нет
+    for number in range(6):
+        assert _login(client, "wrong", f"203.0.113.{number}").status_code == 401
+
+    with mock.patch.object(auth, "verify_password") as verify_password:
+        response = _login(client, "pw", "198.51.100.1")
+
+    assert response.status_code == 429
+    verify_password.assert_not_called()
+    assert ratelimit.metrics["rejected_account_global"] == rejected + 1
@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, inspect
+
+from backend import bench, migrations
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_PROBE = """
+import json, time
+started = time.perf_counter()
+import backend.main
+print(json.dumps({"import_seconds": time.perf_counter() - started}))
+"""
+
+
+def test_app_import_stays_within_budget(tmp_path):
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    import_seconds = json.loads(output.strip().splitlines()[-1])["import_seconds"]
+
+    assert import_seconds < bench.IMPORT_BUDGET_SECONDS
+    assert os.listdir(tmp_path) == []
+
+
+def test_pending_migrations_check_does_not_write(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    try:
+        assert [name for _, name in migrations.pending(engine)] == [
+            name for _, name in migrations.available()
+        ]
+        assert inspect(engine).get_table_names() == []
+
+        migrations.upgrade(engine)
+        assert migrations.pending(engine) == []
+    finally:
+        engine.dispose()